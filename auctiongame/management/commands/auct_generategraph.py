@@ -1,13 +1,33 @@
+from collections import defaultdict
 from decimal import Decimal
 
 import numpy as np
-from django.db import models, transaction
+from django.db import connections, router, transaction
 from django.core.management.base import BaseCommand
 from auctiongame.models import Answer, Result
 from core.models import Session, Game
+from core.utils import StreamingBulkUpdate
 from auctiongame.apps import NAME
 
 
+def histogram_js_data(values, bins):
+    counts, edges = np.histogram(values, bins=bins)
+    return "\n".join(f"['{edge}', {count}]," for count, edge in zip(counts, edges))
+
+
+def auction_histograms(bids, valuations):
+    """Returns the js data of the histograms of the bids and of the valuations of an
+    auction."""
+    bids = np.array(bids)
+    bid_lb, bid_up = int(bids.min()), int(bids.max()) + 1
+    valuations = np.array(valuations)
+    val_min, val_max = valuations.min(), valuations.max()
+    return (
+        histogram_js_data(bids, np.linspace(bid_lb, bid_up, (bid_up - bid_lb) * 4 + 1)),
+        histogram_js_data(valuations, np.arange(val_min, val_max + 2)),
+    )
+
+
 class Command(BaseCommand):
     help = "Populates the database with the graph data for the auction game. Updates answers for the winners."
 
@@ -19,84 +39,86 @@ class Command(BaseCommand):
         # Retrieve session and game
         session = Session.objects.filter(url_tag=options["session"]).first()
         if not session:
-            self.stderr.write(f"ERROR: No session found with URL tag {options['session']}")
+            self.stderr.write(
+                f"ERROR: No session found with URL tag {options['session']}"
+            )
             return
 
-        game = Game.objects.filter(session=session, url_tag=options["game"], game_type=NAME).first()
+        game = Game.objects.filter(
+            session=session, url_tag=options["game"], game_type=NAME
+        ).first()
         if not game:
             self.stderr.write(f"ERROR: No game found with URL tag {options['game']}")
             return
 
-        # Retrieve all answers
-        all_answers = Answer.objects.filter(game=game)
+        # Retrieve all answers at once and group them by auction, bids are converted once
+        answers_per_auction = defaultdict(list)
+        for answer_id, auction_id, valuation, bid in Answer.objects.filter(
+            game=game
+        ).values_list("id", "auction_id", "valuation", "bid"):
+            answers_per_auction[auction_id].append(
+                (answer_id, valuation, None if bid is None else Decimal(bid))
+            )
 
         global_highest_utility = None
-        global_winner = []
-
-        results_to_update = []
-        results_to_create = []
-        answers_to_update = []
-
-        unique_auction_ids = all_answers.values_list("auction_id", flat=True).distinct()
-        for auction_id in unique_auction_ids:
-            # Get or initialize Result object
-            result, created = Result.objects.get_or_create(game=game, auction_id=auction_id)
-
-            answers = all_answers.filter(auction_id=auction_id, bid__isnull=False)
-
+        global_winners = []
+        results = []
+        answer_updates = {}
+        for auction_id, auction_answers in answers_per_auction.items():
+            result = Result(game=game, auction_id=auction_id)
+            results.append(result)
+
+            answers = [a for a in auction_answers if a[2] is not None]
             if not answers:
                 continue
 
-            # Process histogram data for bids
-            bids_values = [Decimal(a) for a in answers.filter(auction_id=auction_id, bid__isnull=False).values_list("bid", flat=True)]
-            bids = np.array(bids_values)
-            bid_lb, bid_up = int(bids.min()), int(bids.max()) + 1
-            bid_bins, bid_counts = np.histogram(bids, bins=np.linspace(bid_lb, bid_up,
-                                                                       (bid_up - bid_lb) * 4 + 1))
-            result.histo_bids_js_data = "\n".join(
-                [f"['{count}', {bin}]," for bin, count in zip(bid_bins, bid_counts)])
-
-            # Process histogram data for valuations
-            valuations = np.array(
-                answers.filter(auction_id=auction_id).values_list("valuation", flat=True))
-            val_min, val_max = valuations.min(), valuations.max()
-            val_bins, val_counts = np.histogram(valuations, bins=np.arange(val_min, val_max + 2))
-            result.histo_val_js_data = "\n".join(
-                [f"['{count}', {bin}]," for bin, count in zip(val_bins, val_counts)])
-
-            if created:
-                results_to_create.append(result)
-            else:
-                results_to_update.append(result)
+            result.histo_bids_js_data, result.histo_val_js_data = auction_histograms(
+                [bid for _, _, bid in answers],
+                [valuation for _, valuation, _ in answers],
+            )
 
             # Determine auction winners
-            bids_decimal = [Decimal(b) for b in bids_values]
-            highest_bid = max(bids_decimal)
-            local_winners = [a for a in answers if Decimal(a.bid) == highest_bid]
-            for answer in answers:
-                if answer.bid:
-                    answer.winning_auction = answer in local_winners
-                    answer.utility = answer.valuation - Decimal(answer.bid) if answer in local_winners else 0
-                answer.winning_global = False
-                answers_to_update.append(answer)
+            highest_bid = max(bid for _, _, bid in answers)
+            local_winners = []
+            for answer_id, valuation, bid in answers:
+                if bid == highest_bid:
+                    local_winners.append(answer_id)
+                    utility = valuation - bid
+                else:
+                    utility = 0
+                answer_updates[answer_id] = {
+                    "utility": utility,
+                    "winning_auction": bid == highest_bid,
+                    "winning_global": False,
+                }
 
             # Global winner selection
-            winning_utility = local_winners[0].utility
-            if global_highest_utility is None or winning_utility > global_highest_utility:
+            winning_utility = answer_updates[local_winners[0]]["utility"]
+            if (
+                global_highest_utility is None
+                or winning_utility > global_highest_utility
+            ):
                 global_highest_utility = winning_utility
-                global_winner = local_winners
+                global_winners = local_winners
             elif winning_utility == global_highest_utility:
-                global_winner.extend(local_winners)
+                global_winners.extend(local_winners)
 
-        # Update all global winner flags and save updates in bulk
-        for answer in global_winner:
-            answer.winning_global = True
-            answers_to_update.append(answer)
+        for answer_id in global_winners:
+            answer_updates[answer_id]["winning_global"] = True
 
-        # Save all results in a single transaction
+        # Save all results in a single transaction, the results are upserted at once
+        connection = connections[router.db_for_write(Result)]
         with transaction.atomic():
-            Result.objects.bulk_create(results_to_create, ignore_conflicts=True)
-            Result.objects.bulk_update(results_to_update,
-                                       ["histo_bids_js_data", "histo_val_js_data"])
-            Answer.objects.bulk_update(answers_to_update,
-                                       ["utility", "winning_auction", "winning_global"])
+            Result.objects.bulk_create(
+                results,
+                update_conflicts=True,
+                unique_fields=(
+                    ["game", "auction_id"]
+                    if connection.features.supports_update_conflicts_with_target
+                    else None
+                ),
+                update_fields=["histo_bids_js_data", "histo_val_js_data"],
+            )
+            with StreamingBulkUpdate(Answer) as answer_writer:
+                for answer_id, values in answer_updates.items():
+                    answer_writer.update(Answer(id=answer_id), **values)
@@ -1,12 +1,15 @@
-from decimal import Decimal, InvalidOperation
+from decimal import Decimal, InvalidOperation, ROUND_FLOOR, localcontext
 
 from django import forms
-from django.core.exceptions import ValidationError
+from django.core.exceptions import FieldDoesNotExist, ValidationError
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
 
 from auctiongame.samplers import ALL_SAMPLERS
 from core.models import Player, Game
+from core.utils import StreamingBulkUpdate
 
 
 class ArbitraryPrecisionDecimalFormField(forms.Field):
@@ -56,6 +59,42 @@ class ArbitraryPrecisionDecimalField(models.TextField):
         return super().formfield(**defaults)
 
 
+class NumericShadowField(models.DecimalField):
+    """Numeric copy of an ArbitraryPrecisionDecimalField (the source field), kept in sync
+    whenever the instance is saved or bulk created. It is used to order and filter in the
+    database. The copy is rounded down to decimal_places (and clamped to max_digits) so it
+    preserves the order, but values that are equal once rounded need to be compared using the
+    exact source value."""
+    description = "Numeric copy of an arbitrary precision decimal"
+
+    def __init__(self, *args, source=None, **kwargs):
+        self.source = source
+        kwargs.setdefault("null", True)
+        kwargs.setdefault("blank", True)
+        kwargs.setdefault("editable", False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["source"] = self.source
+        return name, path, args, kwargs
+
+    def numeric_value(self, value):
+        if value is None:
+            return None
+        with localcontext() as context:
+            context.prec = self.max_digits + 1
+            step = Decimal(1).scaleb(-self.decimal_places)
+            largest_value = Decimal(10) ** (self.max_digits - self.decimal_places) - step
+            value = max(-largest_value, min(largest_value, Decimal(str(value))))
+            return value.quantize(step, rounding=ROUND_FLOOR)
+
+    def pre_save(self, model_instance, add):
+        value = self.numeric_value(getattr(model_instance, self.source))
+        setattr(model_instance, self.attname, value)
+        return value
+
+
 class Setting(models.Model):
     game = models.OneToOneField(
         Game, on_delete=models.CASCADE, related_name="auction_setting"
@@ -86,6 +125,7 @@ class Answer(models.Model):
     auction_id = models.IntegerField()
     valuation = models.IntegerField()
     bid = ArbitraryPrecisionDecimalField(null=True)
+    bid_numeric = NumericShadowField(source="bid", max_digits=40, decimal_places=20)
     utility = ArbitraryPrecisionDecimalField(null=True)
     winning_auction = models.BooleanField(default=False)
     winning_global = models.BooleanField(default=False)
@@ -93,8 +133,13 @@ class Answer(models.Model):
     submission_time = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ["game", "auction_id", "player", "bid"]
+        ordering = ["game", "auction_id", "player", "bid_numeric"]
         unique_together = ("game", "player")
+        indexes = [
+            models.Index(
+                fields=["game", "auction_id", "bid_numeric"], name="auct_game_bid_idx"
+            )
+        ]
 
     def __str__(self):
         return "[{}] {} - {} - {}: {}".format(
@@ -106,6 +151,36 @@ class Answer(models.Model):
         )
 
 
+def fill_missing_bid_numeric(apps, using):
+    """Fills bid_numeric for the answers saved before it existed."""
+    answer_model = apps.get_model("auctiongame", "Answer")
+    bid_numeric_field = answer_model._meta.get_field("bid_numeric")
+    missing_values = (
+        answer_model.objects.using(using)
+        .filter(bid__isnull=False, bid_numeric__isnull=True)
+        .values_list("id", "bid")
+    )
+    with StreamingBulkUpdate(answer_model, using=using) as answer_writer:
+        for answer_id, bid in missing_values.iterator():
+            answer_writer.update(
+                answer_model(id=answer_id),
+                bid_numeric=bid_numeric_field.numeric_value(bid),
+            )
+
+
+# The migrations are generated on each deployment, the backfill is thus run after every
+# migrate instead of being a RunPython step of a shipped migration.
+@receiver(post_migrate, dispatch_uid="auct_backfill_bid_numeric")
+def backfill_bid_numeric_after_migrate(sender, app_config, apps, using, **kwargs):
+    if app_config.label != "auctiongame":
+        return
+    try:
+        apps.get_model("auctiongame", "Answer")._meta.get_field("bid_numeric")
+    except (LookupError, FieldDoesNotExist):
+        return
+    fill_missing_bid_numeric(apps, using)
+
+
 class Result(models.Model):
     game = models.ForeignKey(
         Game, on_delete=models.CASCADE, related_name="results_auct"
@@ -1,7 +1,9 @@
 import os
 import random
 from decimal import Decimal
+from itertools import groupby
 
+from django.db.models import F
 from django.shortcuts import render
 
 from core.game_views import GameResultsView, GameSubmitAnswerView, GameIndexView
@@ -77,41 +79,67 @@ class Results(GameResultsView):
     def get(self, request, session_url_tag, game_url_tag):
         context = self.context
 
-        answers = Answer.objects.filter(game=self.game, bid__isnull=False).order_by("auction_id", "-bid")
-        unique_auction_ids = answers.values_list('auction_id', flat=True).distinct()
-        context["answers"] = answers
-        answers_per_auction = {
-            auction_id: answers.filter(auction_id=auction_id)
-            for auction_id in unique_auction_ids
-        }
-        formatted_winners = {str(auction_id): "" for auction_id in range(1, 6)}
+        # Two queries: the answers (with their players) and the results, grouped below
+        answers = list(
+            Answer.objects.filter(game=self.game, bid__isnull=False)
+            .select_related("player")
+            .order_by("auction_id", F("bid_numeric").desc(nulls_last=True))
+        )
+        results = Result.objects.filter(game=self.game)
+        auction_ids = set(range(1, self.game.auction_setting.number_auctions + 1))
+        auction_ids.update(answer.auction_id for answer in answers)
+        answers_per_auction = {auction_id: [] for auction_id in sorted(auction_ids)}
+        for answer in answers:
+            answers_per_auction[answer.auction_id].append(answer)
+        # The database orders by the rounded copy of the bids, bids with the same copy are
+        # ordered here using their exact value
         for auction_id, auction_answers in answers_per_auction.items():
-            if auction_answers:
-                winning_answers = auction_answers.filter(winning_auction=True)
-                if winning_answers:
-                    winners_formatted = ""
-                    sorted_winners = sorted(list(answer.player.name for answer in winning_answers))
-                    if len(sorted_winners) == 1:
-                        winners_formatted = sorted_winners[0]
-                    else:
-                        for i, w in enumerate(sorted_winners):
-                            if i == len(sorted_winners) - 2:
-                                winners_formatted += f"{w} "
-                            elif i == len(sorted_winners) - 1:
-                                winners_formatted += f"and {w}"
-                            else:
-                                winners_formatted += f"{w}, "
-                    formatted_winners[auction_id] = (winning_answers, winners_formatted)
-        context["answers_per_auction"] = {i: sorted(a, key=lambda x: Decimal(x.bid), reverse=True) for i, a in answers_per_auction.items()}
-        all_results = Result.objects.filter(game=self.game)
-        context["result_per_auction"] = {
-            auction_id: all_results.filter(auction_id=auction_id).first() for auction_id in unique_auction_ids
-        }
+            sorted_answers = []
+            for _, same_numeric_answers in groupby(
+                auction_answers, key=lambda answer: answer.bid_numeric
+            ):
+                sorted_answers.extend(
+                    sorted(
+                        same_numeric_answers,
+                        key=lambda answer: Decimal(answer.bid),
+                        reverse=True,
+                    )
+                )
+            answers_per_auction[auction_id] = sorted_answers
+        result_per_auction = {auction_id: None for auction_id in answers_per_auction}
+        for result in results:
+            result_per_auction[result.auction_id] = result
+
+        formatted_winners = {}
+        for auction_id, auction_answers in answers_per_auction.items():
+            winning_answers = [
+                answer for answer in auction_answers if answer.winning_auction
+            ]
+            if winning_answers:
+                winners_formatted = ""
+                sorted_winners = sorted(
+                    answer.player.name for answer in winning_answers
+                )
+                if len(sorted_winners) == 1:
+                    winners_formatted = sorted_winners[0]
+                else:
+                    for i, w in enumerate(sorted_winners):
+                        if i == len(sorted_winners) - 2:
+                            winners_formatted += f"{w} "
+                        elif i == len(sorted_winners) - 1:
+                            winners_formatted += f"and {w}"
+                        else:
+                            winners_formatted += f"{w}, "
+                formatted_winners[auction_id] = (winning_answers, winners_formatted)
+        context["answers"] = answers
+        context["answers_per_auction"] = answers_per_auction
+        context["result_per_auction"] = result_per_auction
         context["formatted_winners"] = formatted_winners
-        global_winning_answers = answers.filter(winning_global=True)
+        global_winning_answers = [answer for answer in answers if answer.winning_global]
+        context["global_winning_answers"] = global_winning_answers
         if global_winning_answers:
             global_winners_formatted = sorted(
-                list(answer.player.name for answer in global_winning_answers)
+                answer.player.name for answer in global_winning_answers
             )
             if len(global_winners_formatted) > 1:
                 global_winners_formatted[-1] = "and " + global_winners_formatted[-1]
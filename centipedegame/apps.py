@@ -18,6 +18,7 @@ class CentipedeGameConfig(GameConfig):
             URL_TAG,
             URL_NAMESPACE,
             management_commands="centi_computescores",
+            update_management_commands="centi_updatescores",
             answer_model_fields=("strategy_as_p1", "strategy_as_p2", "motivation"),
             illustration_paths=(
                 "centipedegame/img/CentipedeGame1.png",
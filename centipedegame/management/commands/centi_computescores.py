@@ -1,5 +1,11 @@
+import json
+from collections import Counter
+
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
 
+from centipedegame.constants import CENTIPEDE_STRATEGIES
 from centipedegame.models import Answer, Result
 from core.models import Session, Game
 
@@ -7,17 +13,148 @@ from centipedegame.apps import NAME
 from core.utils import float_formatter
 
 
-def payoffs(game, player1, player2):
-    if player1.strategy_as_p1.startswith("Down"):
-        return game.centi_setting.payoff_d_p1, game.centi_setting.payoff_d_p2
-    elif player2.strategy_as_p2.startswith("Down"):
-        return game.centi_setting.payoff_rd_p1, game.centi_setting.payoff_rd_p2
-    elif player1.strategy_as_p1.endswith("Down"):
-        return game.centi_setting.payoff_rrd_p1, game.centi_setting.payoff_rrd_p2
-    elif player2.strategy_as_p2.endswith("Down"):
-        return game.centi_setting.payoff_rrd_p1, game.centi_setting.payoff_rrrd_p2
-    elif player2.strategy_as_p2.endswith("Right"):
-        return game.centi_setting.payoff_rrrr_p1, game.centi_setting.payoff_rrrr_p2
+def payoffs(setting, strategy_as_p1, strategy_as_p2):
+    """Payoffs of the two players when strategy_as_p1 plays against strategy_as_p2."""
+    if strategy_as_p1.startswith("Down"):
+        return setting.payoff_d_p1, setting.payoff_d_p2
+    elif strategy_as_p2.startswith("Down"):
+        return setting.payoff_rd_p1, setting.payoff_rd_p2
+    elif strategy_as_p1.endswith("Down"):
+        return setting.payoff_rrd_p1, setting.payoff_rrd_p2
+    elif strategy_as_p2.endswith("Down"):
+        return setting.payoff_rrd_p1, setting.payoff_rrrd_p2
+    elif strategy_as_p2.endswith("Right"):
+        return setting.payoff_rrrr_p1, setting.payoff_rrrr_p2
+
+
+def payoff_table(setting):
+    """Payoffs of the two players for all the pairs of strategies."""
+    return {
+        (strategy_as_p1, strategy_as_p2): payoffs(
+            setting, strategy_as_p1, strategy_as_p2
+        )
+        for strategy_as_p1 in CENTIPEDE_STRATEGIES
+        for strategy_as_p2 in CENTIPEDE_STRATEGIES
+    }
+
+
+def strategy_counts(game):
+    """Number of answers for each pair of strategies (as player 1, as player 2)."""
+    return Counter(
+        {
+            (strategy_as_p1, strategy_as_p2): num
+            for strategy_as_p1, strategy_as_p2, num in Answer.objects.filter(game=game)
+            .values_list("strategy_as_p1", "strategy_as_p2")
+            .annotate(num=Count("id"))
+            .order_by()
+        }
+    )
+
+
+def counts_to_json(counts):
+    return json.dumps(
+        [
+            [strategy_as_p1, strategy_as_p2, num]
+            for (strategy_as_p1, strategy_as_p2), num in sorted(counts.items())
+        ]
+    )
+
+
+def counts_from_json(json_data):
+    return Counter(
+        {
+            (strategy_as_p1, strategy_as_p2): num
+            for strategy_as_p1, strategy_as_p2, num in json.loads(json_data)
+        }
+    )
+
+
+def marginal_counts(counts):
+    """Numbers of answers playing each strategy as player 1 and as player 2, given the number
+    of answers for each pair of strategies."""
+    counts_as_p1 = Counter()
+    counts_as_p2 = Counter()
+    for (strategy_as_p1, strategy_as_p2), num in counts.items():
+        counts_as_p1[strategy_as_p1] += num
+        counts_as_p2[strategy_as_p2] += num
+    return counts_as_p1, counts_as_p2
+
+
+def strategy_scores(setting, counts):
+    """Average scores of an answer for each pair of strategies played by some answers, given
+    the number of answers for each pair. The scores of an answer only depend on its strategy
+    as player 1 and on the strategies played by the others as player 2, so they are computed
+    from the histogram of the latter. Returns a dictionary mapping the pairs to tuples
+    (avg_score_as_p1, avg_score_as_p2, avg_score, total_score)."""
+    table = payoff_table(setting)
+    counts_as_p1, counts_as_p2 = marginal_counts(counts)
+    # Total payoff against all the answers, including the answer itself
+    totals_as_p1 = {
+        s1: sum(num * table[(s1, s2)][0] for s2, num in counts_as_p2.items())
+        for s1 in counts_as_p1
+    }
+    totals_as_p2 = {
+        s1: sum(num * table[(s1, s2)][1] for s2, num in counts_as_p2.items())
+        for s1 in counts_as_p1
+    }
+    num_opponents = max(sum(counts.values()) - 1, 1)
+    scores = {}
+    for strategy_as_p1, strategy_as_p2 in counts:
+        own_payoffs = table[(strategy_as_p1, strategy_as_p2)]
+        total_score_as_p1 = totals_as_p1[strategy_as_p1] - own_payoffs[0]
+        total_score_as_p2 = totals_as_p2[strategy_as_p1] - own_payoffs[1]
+        total_score = total_score_as_p1 + total_score_as_p2
+        scores[(strategy_as_p1, strategy_as_p2)] = (
+            total_score_as_p1 / num_opponents,
+            total_score_as_p2 / num_opponents,
+            total_score / (2 * num_opponents),  # Dividing by 2 for P1 and P2
+            total_score,
+        )
+    return scores
+
+
+def save_scores(game, counts):
+    """Saves the scores of the answers of the game, and the histograms and heatmap data of
+    the result, given the number of answers for each pair of strategies. All the answers
+    playing the same strategies have the same scores, so they are updated together. The
+    counts are stored in the result for the incremental updates."""
+    scores = strategy_scores(game.centi_setting, counts)
+    best_score = max((score[3] for score in scores.values()), default=None)
+    with transaction.atomic():
+        for (strategy_as_p1, strategy_as_p2), score in scores.items():
+            Answer.objects.filter(
+                game=game, strategy_as_p1=strategy_as_p1, strategy_as_p2=strategy_as_p2
+            ).update(
+                avg_score_as_p1=score[0],
+                avg_score_as_p2=score[1],
+                avg_score=score[2],
+                winning=score[3] == best_score,
+            )
+
+        counts_as_p1, counts_as_p2 = marginal_counts(counts)
+        Result.objects.update_or_create(
+            game=game,
+            defaults={
+                "histo_strat1_js_data": "\n".join(
+                    "['{}', {}],".format(strategy, counts_as_p1[strategy])
+                    for strategy in CENTIPEDE_STRATEGIES
+                    if counts_as_p1[strategy] > 0
+                ),
+                "histo_strat2_js_data": "\n".join(
+                    "['{}', {}],".format(strategy, counts_as_p2[strategy])
+                    for strategy in CENTIPEDE_STRATEGIES
+                    if counts_as_p2[strategy] > 0
+                ),
+                "num_answers": sum(counts.values()),
+                "strategy_counts_json_data": counts_to_json(counts),
+                "scores_heatmap_js_data": "\n".join(
+                    "{{x: '{}', y: '{}', heat: {}}},".format(
+                        key[1], key[0], float_formatter(score[2], num_digits=4)
+                    )
+                    for key, score in sorted(scores.items())
+                ),
+            },
+        )
 
 
 class Command(BaseCommand):
@@ -58,90 +195,4 @@ class Command(BaseCommand):
             return
         game = game.first()
 
-        try:
-            game.result_centi
-        except Result.DoesNotExist:
-            result = Result.objects.create(
-                game=game,
-                histo_strat1_js_data="",
-                histo_strat2_js_data="",
-                scores_heatmap_js_data="",
-            )
-            game.result_centi = result
-            game.save()
-
-        answers = Answer.objects.filter(game=game)
-        if answers:
-            best_score = 0
-            winners = None
-            strat1_histo_data = {}
-            strat2_histo_data = {}
-            score_heatmap_data = {}
-            for answer in answers:
-                total_score_as_p1 = 0
-                total_score_as_p2 = 0
-                for opponent in answers:
-                    if answer != opponent:
-                        score_as_p1, score_as_p2 = payoffs(game, answer, opponent)
-                        total_score_as_p1 += score_as_p1
-                        total_score_as_p2 += score_as_p2
-                answer.avg_score_as_p1 = total_score_as_p1 / max(len(answers) - 1, 1)
-                answer.avg_score_as_p2 = total_score_as_p2 / max(len(answers) - 1, 1)
-                total_score = total_score_as_p1 + total_score_as_p2
-                answer.avg_score = total_score / (
-                    2 * max(len(answers) - 1, 1)
-                )  # Dividing by 2 for P1 and P2
-                answer.save()
-
-                if winners is None or total_score > best_score:
-                    best_score = total_score
-                    winners = [answer]
-                elif total_score == best_score:
-                    winners.append(answer)
-
-                if answer.strategy_as_p1 in strat1_histo_data:
-                    strat1_histo_data[answer.strategy_as_p1] += 1
-                else:
-                    strat1_histo_data[answer.strategy_as_p1] = 1
-                if answer.strategy_as_p2 in strat2_histo_data:
-                    strat2_histo_data[answer.strategy_as_p2] += 1
-                else:
-                    strat2_histo_data[answer.strategy_as_p2] = 1
-                if (
-                    answer.strategy_as_p1,
-                    answer.strategy_as_p2,
-                ) not in score_heatmap_data:
-                    score_heatmap_data[
-                        (answer.strategy_as_p1, answer.strategy_as_p2)
-                    ] = answer.avg_score
-
-                answer.winning = False
-                answer.save()
-            for answer in winners:
-                answer.winning = True
-                answer.save()
-
-            game.result_centi.histo_strat1_js_data = "\n".join(
-                [
-                    "['{}', {}],".format(key, value)
-                    for key, value in strat1_histo_data.items()
-                ]
-            )
-            game.result_centi.histo_strat2_js_data = "\n".join(
-                [
-                    "['{}', {}],".format(key, value)
-                    for key, value in strat2_histo_data.items()
-                ]
-            )
-            game.result_centi.scores_heatmap_js_data = "\n".join(
-                [
-                    "{{x: '{}', y: '{}', heat: {}}},".format(
-                        key[1], key[0], float_formatter(value, num_digits=4)
-                    )
-                    for key, value in sorted(
-                        score_heatmap_data.items(), key=lambda x: x[0]
-                    )
-                ]
-            )
-            game.result_centi.save()
-            game.save()
+        save_scores(game, strategy_counts(game))
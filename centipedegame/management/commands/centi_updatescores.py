@@ -0,0 +1,90 @@
+from django.core import management
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from centipedegame.apps import NAME
+from centipedegame.management.commands.centi_computescores import (
+    counts_from_json,
+    save_scores,
+)
+from centipedegame.models import Answer, Result
+from core.models import Session, Game, Player
+
+
+class Command(BaseCommand):
+    help = (
+        "Updates the values required for the global_results page based on the latest "
+        "submission, using the number of answers per pair of strategies stored in the result."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--session", type=str, required=True)
+        parser.add_argument("--game", type=str, required=True)
+        parser.add_argument("--player", type=str, required=True)
+
+    def handle(self, *args, **options):
+        if not options["session"]:
+            self.stderr.write(
+                "ERROR: you need to give the URL tag of a session with the --session argument"
+            )
+            return
+        session = Session.objects.filter(url_tag=options["session"])
+        if not session.exists():
+            self.stderr.write(
+                "ERROR: no session with URL tag {} has been found".format(
+                    options["session"]
+                )
+            )
+            return
+        session = session.first()
+
+        if not options["game"]:
+            self.stderr.write(
+                "ERROR: you need to give the URL tag of a game with the --game argument"
+            )
+            return
+        game = Game.objects.filter(
+            session=session, url_tag=options["game"], game_type=NAME
+        )
+        if not game.exists():
+            self.stderr.write(
+                "ERROR: no game with URL tag {} has been found".format(options["game"])
+            )
+            return
+        game = game.first()
+
+        player = Player.objects.filter(name=options["player"], session=session)
+        if not player.exists():
+            self.stderr.write(
+                "ERROR: no player with name {} has been found".format(options["player"])
+            )
+            return
+        player = player.first()
+
+        new_answer = Answer.objects.filter(game=game, player=player).first()
+        if new_answer is None:
+            self.stderr.write(
+                "ERROR: the player {} has not submitted an answer".format(player.name)
+            )
+            return
+
+        with transaction.atomic():
+            game_result = Result.objects.select_for_update().filter(game=game).first()
+            num_answers = Answer.objects.filter(game=game).count()
+            # The stored counts can only be used if they cover all the other answers,
+            # otherwise we fall back to computing everything from scratch.
+            if game_result is not None and game_result.strategy_counts_json_data:
+                if game_result.num_answers == num_answers:
+                    # The answer has already been taken into account
+                    return
+                if game_result.num_answers == num_answers - 1:
+                    counts = counts_from_json(game_result.strategy_counts_json_data)
+                    counts[(new_answer.strategy_as_p1, new_answer.strategy_as_p2)] += 1
+                    save_scores(game, counts)
+                    return
+            management.call_command(
+                "centi_computescores",
+                session=session.url_tag,
+                game=game.url_tag,
+                stdout=self.stdout,
+            )
@@ -80,6 +80,9 @@ class Result(models.Model):
     histo_strat1_js_data = models.TextField(null=True, blank=True)
     histo_strat2_js_data = models.TextField(null=True, blank=True)
     scores_heatmap_js_data = models.TextField(null=True, blank=True)
+    # Number of answers for each pair of strategies, used for incremental updates
+    num_answers = models.IntegerField(default=0)
+    strategy_counts_json_data = models.TextField(null=True, blank=True)
 
     class Meta:
         ordering = ["game"]
@@ -121,7 +121,8 @@ class GameConfig(AppConfig):
                 "a string or a collection of string."
             )
         # Commands to use when updating after every new answer. Can be different from
-        # self.management_commands in case there are faster implementation to update.
+        # self.management_commands in case there are faster implementation to update. These
+        # commands receive the name of the player who submitted the answer via --player.
         self.update_management_commands = update_management_commands
 
         # Paths to the illustrations of the game.
@@ -164,7 +165,7 @@ class GameConfig(AppConfig):
             all_commands = {c[0] for c in get_commands().items() if c[1] == self.name}
             for commands in [self.management_commands, self.update_management_commands]:
                 if commands is not None:
-                    for c in self.management_commands:
+                    for c in commands:
                         if c not in all_commands:
                             raise ValueError(
                                 f"For the app {self.name}, the management command "
@@ -89,7 +89,17 @@ class GameSubmitAnswerView(GameView):
             self.post_code_if_form_valid(request, form_object)
             game = self.game
             if game.run_management_after_submit:
-                if game.game_config().management_commands is not None:
+                # If the game has dedicated update commands, they are used as they only need to
+                # take into account the new answer.
+                if game.game_config().update_management_commands is not None:
+                    for cmd_name in game.game_config().update_management_commands:
+                        management.call_command(
+                            cmd_name,
+                            session=self.session.url_tag,
+                            game=game.url_tag,
+                            player=self.context["submitting_player"].name,
+                        )
+                elif game.game_config().management_commands is not None:
                     for cmd_name in game.game_config().management_commands:
                         management.call_command(
                             cmd_name, session=self.session.url_tag, game=game.url_tag
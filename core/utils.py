@@ -1,4 +1,7 @@
 import re
+from io import StringIO
+
+from django.db import connections, router, transaction
 
 
 def float_formatter(value, num_digits=3):
@@ -19,3 +22,150 @@ def float_formatter(value, num_digits=3):
 def sanitise_filename(s):
     """Transform a string into a valid file name resembling the string."""
     return "".join(c for c in s if re.match(r"\w", c)).rstrip()
+
+
+def _copy_text_value(value):
+    """Formats a value for the text format of the PostgreSQL COPY command."""
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class StreamingBulkCreate:
+    """Writes rows of a model to the database by batches of bounded size so that a large
+    number of rows can be created without having all of them in memory. Rows are tuples of
+    values for the given fields (use the attname, e.g., 'answer_id', for foreign keys). With
+    PostgreSQL, batches are sent using COPY, otherwise bulk_create is used. Use it as a context
+    manager, inside transaction.atomic(), to ensure the last batch is written."""
+
+    def __init__(self, model, fields, batch_size=10000, using=None):
+        self.model = model
+        self.fields = tuple(fields)
+        self.batch_size = batch_size
+        self.using = using or router.db_for_write(model)
+        self.batch = []
+        self.num_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, row):
+        self.batch.append(row)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        connection = connections[self.using]
+        if connection.vendor == "postgresql":
+            self._copy(connection)
+        else:
+            self.model.objects.using(self.using).bulk_create(
+                [self.model(**dict(zip(self.fields, row))) for row in self.batch],
+                batch_size=self.batch_size,
+            )
+        self.num_written += len(self.batch)
+        self.batch = []
+
+    def _copy(self, connection):
+        quote_name = connection.ops.quote_name
+        columns = ", ".join(
+            quote_name(self.model._meta.get_field(field).column)
+            for field in self.fields
+        )
+        sql = "COPY {} ({}) FROM STDIN".format(
+            quote_name(self.model._meta.db_table), columns
+        )
+        with connection.cursor() as cursor:
+            raw_cursor = cursor.cursor
+            if hasattr(raw_cursor, "copy_expert"):
+                # psycopg2
+                data = StringIO(
+                    "".join(
+                        "\t".join(_copy_text_value(v) for v in row) + "\n"
+                        for row in self.batch
+                    )
+                )
+                raw_cursor.copy_expert(sql, data)
+            else:
+                # psycopg 3
+                with raw_cursor.copy(sql) as copy:
+                    for row in self.batch:
+                        copy.write_row(row)
+
+
+class StreamingBulkUpdate:
+    """Saves modified instances of a model by batches using bulk_update, instead of calling
+    save() on each of them. Instances are registered with update() together with the new
+    values of their fields. Instances are grouped by the set of fields they update, and each
+    group is written with its own bulk_update so that only the given fields are written,
+    the other fields of an instance (e.g., one built as Model(id=...)) are left untouched.
+    Use it as a context manager: everything is written inside a single transaction.atomic()
+    block, the last batches being written when leaving it."""
+
+    def __init__(self, model, batch_size=500, using=None):
+        self.model = model
+        self.batch_size = batch_size
+        self.using = using or router.db_for_write(model)
+        self.batches = {}
+        self.pending_fields = {}
+        self.num_written = 0
+        self._atomic = None
+
+    def __enter__(self):
+        self._atomic = transaction.atomic(using=self.using)
+        self._atomic.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.flush()
+        except Exception as e:
+            self._atomic.__exit__(type(e), e, e.__traceback__)
+            raise
+        return self._atomic.__exit__(exc_type, exc_value, traceback)
+
+    def update(self, instance, **values):
+        for field, value in values.items():
+            setattr(instance, field, value)
+        fields = frozenset(values)
+        previous_fields = self.pending_fields.get(instance.pk)
+        if previous_fields is not None and previous_fields != fields:
+            # The instance is already pending with other fields, it is moved to the group
+            # of the union of the fields
+            previous = self.batches[previous_fields].pop(instance.pk)
+            for field in previous_fields - fields:
+                setattr(instance, field, getattr(previous, field))
+            fields |= previous_fields
+        self.pending_fields[instance.pk] = fields
+        batch = self.batches.setdefault(fields, {})
+        batch[instance.pk] = instance
+        if len(batch) >= self.batch_size:
+            self._flush_batch(fields)
+
+    def _flush_batch(self, fields):
+        batch = self.batches.pop(fields)
+        if not batch:
+            return
+        self.model.objects.using(self.using).bulk_update(
+            list(batch.values()), sorted(fields)
+        )
+        for pk in batch:
+            del self.pending_fields[pk]
+        self.num_written += len(batch)
+
+    def flush(self):
+        for fields in list(self.batches):
+            self._flush_batch(fields)
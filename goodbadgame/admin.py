@@ -1,11 +1,13 @@
 from django.contrib import admin
 
 from goodbadgame.models import (
+    AccuracyPoint,
     Alternative,
     Question,
     Answer,
     Result,
     QuestionResult,
+    QuestionAccuracyPoint,
     QuestionAnswer,
     Setting,
 )
@@ -14,6 +16,8 @@ admin.site.register(Alternative)
 admin.site.register(Question)
 admin.site.register(Answer)
 admin.site.register(Result)
+admin.site.register(AccuracyPoint)
 admin.site.register(QuestionResult)
+admin.site.register(QuestionAccuracyPoint)
 admin.site.register(QuestionAnswer)
 admin.site.register(Setting)
@@ -1,10 +1,47 @@
-from collections import Counter, defaultdict
+from collections import defaultdict
+from itertools import groupby
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
 
 from core.models import Session, Game
+from core.utils import StreamingBulkCreate, StreamingBulkUpdate
 from goodbadgame.apps import NAME
-from goodbadgame.models import Question, QuestionResult, Result, Answer, QuestionAnswer
+from goodbadgame.models import (
+    AccuracyPoint,
+    Question,
+    QuestionAccuracyPoint,
+    QuestionResult,
+    Result,
+    Answer,
+    QuestionAnswer,
+)
+
+
+def question_accuracy_timelines(question_answers):
+    """Yields, for each question, its id, the fields of its QuestionResult and the points of
+    its accuracy graph. The input is an iterable of (question_id, submission_time, is_correct)
+    tuples ordered by question and submission time. The graph has one point per distinct
+    submission time: the number of answers submitted up to then and their accuracy."""
+    for question_id, rows in groupby(question_answers, key=lambda row: row[0]):
+        points = []
+        num_correct = 0
+        num_wrong = 0
+        accuracy = 0
+        for _, same_time_rows in groupby(rows, key=lambda row: row[1]):
+            for _, _, is_correct in same_time_rows:
+                if is_correct:
+                    num_correct += 1
+                else:
+                    num_wrong += 1
+            accuracy = num_correct / (num_correct + num_wrong)
+            points.append((num_correct + num_wrong, accuracy))
+        yield question_id, {
+            "num_correct_answers": num_correct,
+            "num_wrong_answers": num_wrong,
+            "accuracy": accuracy,
+        }, points
 
 
 class Command(BaseCommand):
@@ -53,90 +90,133 @@ class Command(BaseCommand):
         except Result.DoesNotExist:
             game_result = Result.objects.create(game=game)
 
-        # Results for each question
-        QuestionResult.objects.filter(result=game_result).delete()
-        for question in game.goodbad_setting.questions.all():
-            answers = question.answers.filter(answer__game=game)
-            if answers.exists():
-                timestamps = (
-                    answers.order_by("submission_time")
-                    .values_list("submission_time", flat=True)
-                    .distinct()
-                )
-                graph_js_data = ""
-                num_correct = 0
-                num_wrong = 0
-                accuracy = 0
-                for timestamp in timestamps:
-                    tmp_answers = answers.filter(submission_time__lte=timestamp)
-                    num_correct = tmp_answers.filter(is_correct=True).count()
-                    num_wrong = tmp_answers.filter(is_correct=False).count()
-                    accuracy = num_correct / (num_correct + num_wrong)
-                    graph_js_data += "['{}', '{}'],\n".format(
-                        tmp_answers.count(), accuracy
-                    )
-                QuestionResult.objects.update_or_create(
+        # Results for each question, computed from the answers ordered by submission time
+        questions = list(game.goodbad_setting.questions.all())
+        question_answers = (
+            QuestionAnswer.objects.filter(answer__game=game, question__in=questions)
+            .order_by("question_id", "submission_time")
+            .values_list("question_id", "submission_time", "is_correct")
+        )
+        question_results = {}
+        question_points = {}
+        for question_id, fields, points in question_accuracy_timelines(
+            question_answers
+        ):
+            question_results[question_id] = fields
+            question_points[question_id] = points
+        with transaction.atomic():
+            QuestionResult.objects.filter(result=game_result).delete()
+            QuestionResult.objects.bulk_create(
+                QuestionResult(
                     result=game_result,
                     question=question,
-                    defaults={
-                        "num_correct_answers": num_correct,
-                        "num_wrong_answers": num_wrong,
-                        "accuracy": accuracy,
-                        "graph_js_data": graph_js_data,
-                    },
+                    **question_results[question.id],
                 )
+                for question in questions
+                if question.id in question_results
+            )
+            # Primary keys are not set by bulk_create on all databases, we fetch them
+            with StreamingBulkCreate(
+                QuestionAccuracyPoint, ("question_result_id", "num_answers", "accuracy")
+            ) as point_writer:
+                for question_id, question_result_id in QuestionResult.objects.filter(
+                    result=game_result
+                ).values_list("question_id", "id"):
+                    for num_answers, accuracy in question_points[question_id]:
+                        point_writer.add((question_result_id, num_answers, accuracy))
 
-        # Creating the overall accuracy graph
-        answers = sorted(
-            Answer.objects.filter(game=game).exclude(question_answers=None),
-            key=lambda ans: ans.question_answers.first().submission_time,
+        # Creating the overall accuracy graph. The question answers of the game are loaded
+        # at once, the database checks them against the correct alternatives.
+        question_answers = (
+            QuestionAnswer.objects.filter(answer__game=game)
+            .annotate(
+                correct=ExpressionWrapper(
+                    Q(selected_alt_id=F("question__correct_alt_id")),
+                    output_field=BooleanField(),
+                )
+            )
+            .order_by("answer_id", "id")
+            .values_list(
+                "id",
+                "answer_id",
+                "question_id",
+                "submission_time",
+                "is_correct",
+                "correct",
+            )
         )
-        for answer in answers:
-            question_answers = answer.question_answers.all()
-            for question_answer in question_answers:
-                if question_answer.selected_alt == question_answer.question.correct_alt:
-                    question_answer.is_correct = True
-                else:
-                    question_answer.is_correct = False
-            QuestionAnswer.objects.bulk_update(question_answers, ["is_correct"])
-            answer.score = answer.question_answers.filter(is_correct=True).count()
-            answer.accuracy = answer.score / answer.question_answers.count()
-        Answer.objects.bulk_update(answers, ["score", "accuracy"])
-        accuracy_js_data = ""
-        current_answers = []
+        accuracy_points = []
         questions_count = defaultdict(lambda: 0)
         crowd_num_correct = 0
         crowd_num_wrong = 0
         crowd_accuracy = 0
         total_accuracy = 0
         num_answers = 0
-        for num_answers, new_answer in enumerate(answers):
-            current_answers.append(new_answer)
-            for question_answer in new_answer.question_answers.all():
-                if question_answer.is_correct:
-                    questions_count[question_answer.question] += 1
-                else:
-                    questions_count[question_answer.question] -= 1
-            crowd_num_correct = 0
-            crowd_num_wrong = 0
-            for v in questions_count.values():
-                if v > 0:
-                    crowd_num_correct += 1
+        question_answer_writer = StreamingBulkUpdate(QuestionAnswer)
+        answer_writer = StreamingBulkUpdate(Answer)
+        with question_answer_writer, answer_writer:
+            answers = defaultdict(list)
+            first_submission_times = {}
+            for (
+                question_answer_id,
+                answer_id,
+                question_id,
+                submission_time,
+                is_correct,
+                correct,
+            ) in question_answers:
+                answers[answer_id].append((question_id, correct))
+                first_submission_times.setdefault(answer_id, submission_time)
+                if is_correct != correct:
+                    question_answer_writer.update(
+                        QuestionAnswer(id=question_answer_id), is_correct=correct
+                    )
+
+            # The answers are considered in the order in which they have been submitted
+            sorted_answer_ids = sorted(answers, key=first_submission_times.__getitem__)
+            for num_answers, answer_id in enumerate(sorted_answer_ids):
+                score = 0
+                for question_id, correct in answers[answer_id]:
+                    if correct:
+                        score += 1
+                        questions_count[question_id] += 1
+                    else:
+                        questions_count[question_id] -= 1
+                accuracy = score / len(answers[answer_id])
+                answer_writer.update(
+                    Answer(id=answer_id), score=score, accuracy=accuracy
+                )
+                crowd_num_correct = 0
+                crowd_num_wrong = 0
+                for v in questions_count.values():
+                    if v > 0:
+                        crowd_num_correct += 1
+                    else:
+                        crowd_num_wrong += 1
+                if crowd_num_correct + crowd_num_wrong > 0:
+                    crowd_accuracy = crowd_num_correct / (
+                        crowd_num_correct + crowd_num_wrong
+                    )
                 else:
-                    crowd_num_wrong += 1
-            if crowd_num_correct + crowd_num_wrong > 0:
-                crowd_accuracy = crowd_num_correct / (
-                    crowd_num_correct + crowd_num_wrong
+                    crowd_accuracy = 0
+                total_accuracy += accuracy
+                accuracy_points.append(
+                    (
+                        num_answers + 1,
+                        crowd_accuracy,
+                        total_accuracy / (num_answers + 1),
+                    )
                 )
-            else:
-                crowd_accuracy = 0
-            total_accuracy += new_answer.accuracy
-            accuracy_js_data += "['{}', '{}', '{}'],\n".format(
-                num_answers + 1, crowd_accuracy, total_accuracy / (num_answers + 1)
-            )
 
-        game_result.accuracy_js_data = accuracy_js_data
-        game_result.average_accuracy = total_accuracy / (num_answers + 1)
-        game_result.crowd_num_correct = crowd_num_correct
-        game_result.crowd_accuracy = crowd_accuracy
-        game_result.save()
+        with transaction.atomic():
+            AccuracyPoint.objects.filter(result=game_result).delete()
+            with StreamingBulkCreate(
+                AccuracyPoint,
+                ("result_id", "num_answers", "crowd_accuracy", "average_accuracy"),
+            ) as point_writer:
+                for point in accuracy_points:
+                    point_writer.add((game_result.id,) + point)
+            game_result.average_accuracy = total_accuracy / (num_answers + 1)
+            game_result.crowd_num_correct = crowd_num_correct
+            game_result.crowd_accuracy = crowd_accuracy
+            game_result.save()
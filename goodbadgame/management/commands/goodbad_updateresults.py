@@ -2,7 +2,13 @@ from django.core.management.base import BaseCommand
 
 from core.models import Session, Game, Player
 from goodbadgame.apps import NAME
-from goodbadgame.models import Answer, Result, QuestionResult
+from goodbadgame.models import (
+    AccuracyPoint,
+    Answer,
+    QuestionAccuracyPoint,
+    QuestionResult,
+    Result,
+)
 
 
 class Command(BaseCommand):
@@ -60,7 +66,7 @@ class Command(BaseCommand):
             return
         player = player.first()
 
-        if not game_result.accuracy_js_data:
+        if game_result.average_accuracy is None:
             old_avg_acc = 0
         else:
             old_avg_acc = game_result.average_accuracy
@@ -85,22 +91,21 @@ class Command(BaseCommand):
             new_avg_acc = old_avg_acc + (player_acc - old_avg_acc) / num_answers
             game_result.average_accuracy = new_avg_acc
 
-            # Updating question result
+            # Updating question result, the graphs only receive a new point
             crowd_improvement = 0
+            question_points = []
             for question_answer in player_question_answers.all():
                 question_result, _ = QuestionResult.objects.get_or_create(
                     result=game_result, question=question_answer.question
                 )
                 # If it is the first answer we initialise
-                if question_result.graph_js_data is None:
+                if question_result.num_correct_answers is None:
                     if question_answer.is_correct:
-                        question_result.graph_js_data = "['1', '1'],\n"
                         question_result.num_correct_answers = 1
                         question_result.num_wrong_answers = 0
                         question_result.accuracy = 1.0
                         crowd_improvement += 1
                     else:
-                        question_result.graph_js_data = "['1', '0'],\n"
                         question_result.num_correct_answers = 0
                         question_result.num_wrong_answers = 1
                         question_result.accuracy = 0.0
@@ -120,10 +125,16 @@ class Command(BaseCommand):
                     question_num_answers = question_num_correct + question_num_wrong
                     question_accuracy = question_num_correct / question_num_answers
                     question_result.accuracy = question_accuracy
-                    question_result.graph_js_data += (
-                        f"['{question_num_answers}', " f"'{question_accuracy}'],\n"
-                    )
                 question_result.save()
+                question_points.append(
+                    QuestionAccuracyPoint(
+                        question_result=question_result,
+                        num_answers=question_result.num_correct_answers
+                        + question_result.num_wrong_answers,
+                        accuracy=question_result.accuracy,
+                    )
+                )
+            QuestionAccuracyPoint.objects.bulk_create(question_points)
 
             # Updating crowd accuracy
             if game_result.crowd_num_correct is None:
@@ -131,16 +142,12 @@ class Command(BaseCommand):
             else:
                 game_num_correct = game_result.crowd_num_correct + crowd_improvement
             game_num_answers = QuestionResult.objects.filter(result=game_result).count()
-            if game_result.accuracy_js_data is None:
-                old_accuracy_js_data = ""
-            else:
-                old_accuracy_js_data = game_result.accuracy_js_data
-            old_accuracy_js_data += (
-                f"['{num_answers}', "
-                f"'{game_num_correct / game_num_answers}', "
-                f"'{new_avg_acc}'],\n"
+            AccuracyPoint.objects.create(
+                result=game_result,
+                num_answers=num_answers,
+                crowd_accuracy=game_num_correct / game_num_answers,
+                average_accuracy=new_avg_acc,
             )
-            game_result.accuracy_js_data = old_accuracy_js_data
             game_result.crowd_num_correct = game_num_correct
             game_result.crowd_accuracy = game_num_correct / game_num_answers
             game_result.save()
@@ -1,10 +1,12 @@
+import re
 from random import shuffle
 
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models.signals import post_migrate, post_save
 from django.dispatch import receiver
 
 from core.models import Game, Player
+from core.utils import StreamingBulkCreate
 
 
 class Alternative(models.Model):
@@ -96,10 +98,23 @@ class QuestionAnswer(models.Model):
         )
 
 
+def points_to_js_data(points, fields):
+    """Renders a time series in the format used by the charts: one line per point with the
+    values of the given fields as strings."""
+    return "".join(
+        "[{}],\n".format(
+            ", ".join("'{}'".format(getattr(point, field)) for field in fields)
+        )
+        for point in points
+    )
+
+
 class Result(models.Model):
     game = models.OneToOneField(
         Game, on_delete=models.CASCADE, related_name="goodbad_result"
     )
+    # Graph stored as js data before the points were stored as rows, it is moved to
+    # AccuracyPoint after migrating
     accuracy_js_data = models.TextField(null=True, blank=True)
     average_accuracy = models.FloatField(blank=True, null=True)
     crowd_num_correct = models.IntegerField(blank=True, null=True)
@@ -108,10 +123,31 @@ class Result(models.Model):
     class Meta:
         ordering = ["game"]
 
+    def accuracy_points_js_data(self):
+        return points_to_js_data(
+            self.accuracy_points.all(),
+            ("num_answers", "crowd_accuracy", "average_accuracy"),
+        )
+
     def __str__(self):
         return "{} - Results Data".format(self.game.name)
 
 
+class AccuracyPoint(models.Model):
+    """A point of the crowd accuracy graph, stored as its own row so that a new submission
+    only appends a point instead of rewriting the whole graph."""
+
+    result = models.ForeignKey(
+        Result, on_delete=models.CASCADE, related_name="accuracy_points"
+    )
+    num_answers = models.IntegerField()
+    crowd_accuracy = models.FloatField()
+    average_accuracy = models.FloatField()
+
+    class Meta:
+        ordering = ["result", "num_answers", "id"]
+
+
 class QuestionResult(models.Model):
     result = models.ForeignKey(
         Result, on_delete=models.CASCADE, related_name="questions_result"
@@ -122,13 +158,107 @@ class QuestionResult(models.Model):
     num_correct_answers = models.IntegerField(blank=True, null=True)
     num_wrong_answers = models.IntegerField(blank=True, null=True)
     accuracy = models.FloatField(blank=True, null=True)
+    # Graph stored as js data before the points were stored as rows, it is moved to
+    # QuestionAccuracyPoint after migrating
     graph_js_data = models.TextField(null=True, blank=True)
 
     class Meta:
         ordering = ["question"]
         unique_together = ("result", "question")
 
+    def accuracy_points_js_data(self):
+        return points_to_js_data(
+            self.accuracy_points.all(), ("num_answers", "accuracy")
+        )
+
     def __str__(self):
         return "{} - {} - {}".format(
             self.result.game.session, self.result.game.name, self.question.title
         )
+
+
+class QuestionAccuracyPoint(models.Model):
+    """A point of the accuracy graph of a question."""
+
+    question_result = models.ForeignKey(
+        QuestionResult, on_delete=models.CASCADE, related_name="accuracy_points"
+    )
+    num_answers = models.IntegerField()
+    accuracy = models.FloatField()
+
+    class Meta:
+        ordering = ["question_result", "num_answers", "id"]
+
+
+JS_DATA_VALUE = re.compile(r"'([^']*)'")
+
+
+def parse_js_data(js_data):
+    """Parses a graph rendered by points_to_js_data, returns the values of each point as
+    strings."""
+    return [
+        JS_DATA_VALUE.findall(line) for line in js_data.splitlines() if line.strip()
+    ]
+
+
+def move_js_data_to_points(apps, using):
+    """Creates the points of the graphs that were stored as js data and clears the js
+    data. The graphs of the results that already have points are only cleared."""
+    result_model = apps.get_model("goodbadgame", "Result")
+    question_result_model = apps.get_model("goodbadgame", "QuestionResult")
+    with transaction.atomic(using=using):
+        results = result_model.objects.using(using).filter(
+            accuracy_js_data__isnull=False
+        )
+        with StreamingBulkCreate(
+            apps.get_model("goodbadgame", "AccuracyPoint"),
+            ("result_id", "num_answers", "crowd_accuracy", "average_accuracy"),
+            using=using,
+        ) as point_writer:
+            for result_id, js_data in results.filter(
+                accuracy_points__isnull=True
+            ).values_list("id", "accuracy_js_data"):
+                for num_answers, crowd_accuracy, average_accuracy in parse_js_data(
+                    js_data
+                ):
+                    point_writer.add(
+                        (
+                            result_id,
+                            int(float(num_answers)),
+                            float(crowd_accuracy),
+                            float(average_accuracy),
+                        )
+                    )
+        results.update(accuracy_js_data=None)
+
+        question_results = question_result_model.objects.using(using).filter(
+            graph_js_data__isnull=False
+        )
+        with StreamingBulkCreate(
+            apps.get_model("goodbadgame", "QuestionAccuracyPoint"),
+            ("question_result_id", "num_answers", "accuracy"),
+            using=using,
+        ) as point_writer:
+            for question_result_id, js_data in question_results.filter(
+                accuracy_points__isnull=True
+            ).values_list("id", "graph_js_data"):
+                for num_answers, accuracy in parse_js_data(js_data):
+                    point_writer.add(
+                        (question_result_id, int(float(num_answers)), float(accuracy))
+                    )
+        question_results.update(graph_js_data=None)
+
+
+# The migrations are generated on each deployment, the js data columns are thus kept and
+# moved to the points after every migrate instead of in a RunPython step of a shipped
+# migration.
+@receiver(post_migrate, dispatch_uid="goodbad_move_js_data_to_points")
+def move_js_data_to_points_after_migrate(sender, app_config, apps, using, **kwargs):
+    if app_config.label != "goodbadgame":
+        return
+    try:
+        apps.get_model("goodbadgame", "AccuracyPoint")
+        apps.get_model("goodbadgame", "QuestionAccuracyPoint")
+    except LookupError:
+        return
+    move_js_data_to_points(apps, using)
@@ -1,5 +1,7 @@
 import random
 
+from django.db import transaction
+
 from goodbadgame.models import Answer, QuestionAnswer
 
 
@@ -17,28 +19,41 @@ def assign_random_questions(game, player_answer):
 
 
 def create_random_answers(game, players):
+    # The questions and their alternatives are loaded once, everything else is sampled here
+    setting = game.goodbad_setting
+    questions = list(setting.questions.prefetch_related("alternatives"))
+    num_questions = min(len(questions), setting.num_displayed_questions)
+
     answers = []
     for player in players:
         answers.append(Answer(game=game, player=player))
     answers = Answer.objects.bulk_create(answers)
 
+    answer_questions = []
     question_answers = []
     for player_answer in answers:
-        assign_random_questions(game, player_answer)
-
-        for question in player_answer.questions.all():
-            selected_alt = (
-                question.correct_alt
+        # Sorting the indices keeps the questions in their default order
+        for question_index in sorted(
+            random.sample(range(len(questions)), num_questions)
+        ):
+            question = questions[question_index]
+            answer_questions.append(
+                Answer.questions.through(answer=player_answer, question=question)
+            )
+            selected_alt_id = (
+                question.correct_alt_id
                 if random.random() > 0.45
-                else random.choice(question.alternatives.all())
+                else random.choice(question.alternatives.all()).id
             )
             question_answers.append(
                 QuestionAnswer(
                     answer=player_answer,
                     question=question,
-                    selected_alt=selected_alt,
-                    is_correct=selected_alt == question.correct_alt,
+                    selected_alt_id=selected_alt_id,
+                    is_correct=selected_alt_id == question.correct_alt_id,
                 )
             )
-    QuestionAnswer.objects.bulk_create(question_answers)
+    with transaction.atomic():
+        Answer.questions.through.objects.bulk_create(answer_questions)
+        QuestionAnswer.objects.bulk_create(question_answers)
     return answers
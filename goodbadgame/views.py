@@ -2,6 +2,7 @@ import csv
 import os
 import random
 
+from django.db import transaction
 from django.http import Http404, HttpResponse
 from django.shortcuts import render, get_object_or_404
 
@@ -49,19 +50,32 @@ class SubmitAnswer(GameSubmitAnswerView):
         return True, None
 
     def post_code_if_form_valid(self, request, form_object):
-        for question in self.context["answer"].questions.all():
+        question_answers = []
+        for question in self.context["answer"].questions.prefetch_related(
+            "alternatives"
+        ):
             if question.slug + "_selector" in request.POST:
-                QuestionAnswer.objects.create(
-                    answer=self.context["answer"],
-                    question=question,
-                    selected_alt=question.alternatives.get(
-                        id=request.POST.get(question.slug + "_selector")
-                    ),
-                    is_correct=Alternative.objects.get(
-                        id=request.POST.get(question.slug + "_selector")
+                selected_id = request.POST.get(question.slug + "_selector")
+                selected_alt = None
+                for alternative in question.alternatives.all():
+                    if str(alternative.id) == selected_id:
+                        selected_alt = alternative
+                        break
+                if selected_alt is None:
+                    raise Alternative.DoesNotExist(
+                        f"The alternative {selected_id} is not one of the question "
+                        f"{question.slug}."
+                    )
+                question_answers.append(
+                    QuestionAnswer(
+                        answer=self.context["answer"],
+                        question=question,
+                        selected_alt=selected_alt,
+                        is_correct=selected_alt.id == question.correct_alt_id,
                     )
-                    == question.correct_alt,
                 )
+        with transaction.atomic():
+            QuestionAnswer.objects.bulk_create(question_answers)
         self.context["submitted_answer"] = True
 
     def post_code_render(self, request):
@@ -73,15 +87,25 @@ class SubmitAnswer(GameSubmitAnswerView):
 class Results(GameResultsView):
     def get(self, request, session_url_tag, game_url_tag):
         context = self.context
-        game_result = Result.objects.filter(game=self.game).first()
+        game_result = (
+            Result.objects.filter(game=self.game)
+            .prefetch_related("accuracy_points")
+            .first()
+        )
 
         if Answer.objects.filter(game=self.game).exists() and game_result:
             context["global_results"] = True
             context["game_result"] = game_result
 
+            question_results = {
+                question_result.question_id: question_result
+                for question_result in game_result.questions_result.prefetch_related(
+                    "accuracy_points"
+                )
+            }
             questions_answer_result = []
             for question in self.game.goodbad_setting.questions.all():
-                question_result = question.results.filter(result=game_result).first()
+                question_result = question_results.get(question.id)
                 questions_answer_result.append((question, None, question_result))
             context["questions_answer_result"] = questions_answer_result
 
@@ -105,17 +129,25 @@ def results(request, session_url_tag, game_url_tag):
         )
 
     answer = context["answer"]
-    game_result = Result.objects.filter(game=game).first()
+    game_result = (
+        Result.objects.filter(game=game).prefetch_related("accuracy_points").first()
+    )
 
     if game_result:
         context["game_result"] = game_result
         if answer:
+            question_results = {
+                question_result.question_id: question_result
+                for question_result in game_result.questions_result.prefetch_related(
+                    "accuracy_points"
+                )
+            }
             questions_answer_result = []
             for question in answer.questions.all():
                 question_answer = answer.question_answers.filter(
                     question=question
                 ).first()
-                question_result = question.results.filter(result=game_result).first()
+                question_result = question_results.get(question.id)
                 questions_answer_result.append(
                     (question, question_answer, question_result)
                 )
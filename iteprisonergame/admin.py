@@ -1,7 +1,9 @@
 from django.contrib import admin
 
-from .models import Answer, Score, Setting
+from .models import Answer, Result, Score, ScoreMatrix, Setting
 
 admin.site.register(Answer)
+admin.site.register(Result)
 admin.site.register(Score)
+admin.site.register(ScoreMatrix)
 admin.site.register(Setting)
@@ -18,6 +18,7 @@ class ItePrisonerGameConfig(GameConfig):
             URL_TAG,
             URL_NAMESPACE,
             management_commands=["ipd_computeresults", "ipd_generategraphdata"],
+            update_management_commands=["ipd_updateresults"],
             answer_model_fields=("name", "avg_score", "motivation"),
             illustration_paths=(
                 "iteprisonergame/img/IPD1.png",
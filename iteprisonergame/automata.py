@@ -1,8 +1,13 @@
+import hashlib
+import json
 import re
+from array import array
 
+import numpy as np
 
-class AutomataNotIsomorphicError(ValueError):
-    pass
+
+SYMBOLS = ("C", "D")
+SYMBOL_INDEX = {"C": 0, "D": 1}
 
 
 class MooreMachine:
@@ -96,101 +101,128 @@ class MooreMachine:
                     f"not be reached: {' '.join(unconnected_states)}"
                 )
 
+    def compile(self):
+        """Returns the compiled (integer-indexed) version of the automaton, used for fast
+        simulation."""
+        return CompiledMooreMachine.from_moore_machine(self)
+
     def transition(self, input_symbol):
         self.current_state = self.transitions[self.current_state][input_symbol]
 
-    def is_isomorphic(self, other_automata):
-        def aux(self_state, other_state):
-            if self.outcome[self_state] != other_automata.outcome[other_state]:
-                raise AutomataNotIsomorphicError("The automatas are not isomorphic")
-            state_renaming[self_state] = other_state
+    def minimize(self):
+        """Returns the minimal automaton equivalent to this one, computed by Moore's partition
+        refinement over the states reachable from the initial state. The states of the minimal
+        automaton are numbered "0", "1", ... in the order in which they are discovered by a
+        breadth-first search from the initial state (following "C" before "D"), so that two
+        equivalent automata have the exact same minimal automaton."""
+        reachable = [self.initial_state]
+        seen = {self.initial_state}
+        for state in reachable:
             for input_symbol in ("C", "D"):
-                self_next_state = self.transitions[self_state][input_symbol]
-                other_next_state = other_automata.transitions[other_state][input_symbol]
-                # print(self_state, other_state, input_symbol, self_next_state, other_next_state)
-                if self_next_state in state_renaming:
-                    if state_renaming[self_next_state] != other_next_state:
-                        raise AutomataNotIsomorphicError(
-                            "The automatas are not isomorphic"
-                        )
-                else:
-                    state_renaming[self_next_state] = other_next_state
-                    aux(self_next_state, other_next_state)
+                next_state = self.transitions[state][input_symbol]
+                if next_state not in seen:
+                    seen.add(next_state)
+                    reachable.append(next_state)
 
-        if len(self.transitions) != len(other_automata.transitions):
-            return False
+        # Start by splitting the states based on their outcome and refine until stable
+        block = {state: self.outcome[state] for state in reachable}
+        num_blocks = len(set(block.values()))
+        while True:
+            signatures = {
+                state: (
+                    block[state],
+                    block[self.transitions[state]["C"]],
+                    block[self.transitions[state]["D"]],
+                )
+                for state in reachable
+            }
+            block_index = {}
+            for state in reachable:
+                block_index.setdefault(signatures[state], len(block_index))
+            block = {state: block_index[signatures[state]] for state in reachable}
+            if len(block_index) == num_blocks:
+                break
+            num_blocks = len(block_index)
 
-        state_renaming = {self.initial_state: other_automata.initial_state}
-        try:
-            aux(self.initial_state, other_automata.initial_state)
-        except AutomataNotIsomorphicError:
-            return False
-        return True
+        representative = {}
+        for state in reachable:
+            representative.setdefault(block[state], state)
+        canonical_index = {block[self.initial_state]: 0}
+        order = [block[self.initial_state]]
+        for current_block in order:
+            for input_symbol in ("C", "D"):
+                next_block = block[
+                    self.transitions[representative[current_block]][input_symbol]
+                ]
+                if next_block not in canonical_index:
+                    canonical_index[next_block] = len(order)
+                    order.append(next_block)
 
-    def json_data(self):
-        seen_states = set()
-        state_list = []
+        minimal = MooreMachine()
+        minimal.initial_state = "0"
+        for current_block in order:
+            state = representative[current_block]
+            name = str(canonical_index[current_block])
+            for input_symbol in ("C", "D"):
+                next_block = block[self.transitions[state][input_symbol]]
+                minimal.add_transition(
+                    name, input_symbol, str(canonical_index[next_block])
+                )
+            minimal.add_outcome(name, self.outcome[state])
+        return minimal
+
+    def canonical_form(self, is_minimal=False):
+        """Returns a string describing the minimal automaton equivalent to this one. Two
+        automata behave the same against any opponent if and only if they have the same
+        canonical form. If is_minimal is True, the automaton has been returned by minimize()
+        and is not minimised again."""
+        minimal = self if is_minimal else self.minimize()
+        return ";".join(
+            "{},{},{}".format(
+                minimal.outcome[state],
+                minimal.transitions[state]["C"],
+                minimal.transitions[state]["D"],
+            )
+            for state in minimal.transitions
+        )
+
+    def canonical_hash(self, is_minimal=False):
+        """Hash of the canonical form of the automaton."""
+        return hashlib.sha256(self.canonical_form(is_minimal).encode()).hexdigest()
+
+    def graph_data(self):
+        """Returns the description of the automaton as a graph (dictionary with a list of nodes
+        and a list of edges) as used by the d3 visualisation. Edges refer to nodes by their
+        index."""
+        state_index = {state: i for i, state in enumerate(self.transitions)}
         nodes = []
-        links = []
+        edges = []
         for state, transition in self.transitions.items():
-            if state not in seen_states:
-                state_list.append(state)
-                seen_states.add(state)
-            next_state_coop = transition["C"]
-            if next_state_coop not in seen_states:
-                state_list.append(next_state_coop)
-                seen_states.add(next_state_coop)
-            next_state_def = transition["D"]
-            if next_state_def not in seen_states:
-                state_list.append(next_state_def)
-                seen_states.add(next_state_def)
             nodes.append(
                 {
-                    "id": state_list.index(state),
+                    "id": state_index[state],
                     "name": self.outcome[state],
                     "init": str(state == self.initial_state),
                 }
             )
-            if next_state_coop == next_state_def:
-                links.append(
-                    {
-                        "id": len(links),
-                        "source": state_list.index(state),
-                        "target": state_list.index(next_state_coop),
-                        "label": "CD",
-                    }
-                )
+            if transition["C"] == transition["D"]:
+                labelled_targets = (("CD", transition["C"]),)
             else:
-                links.append(
+                labelled_targets = (("C", transition["C"]), ("D", transition["D"]))
+            for label, next_state in labelled_targets:
+                edges.append(
                     {
-                        "id": len(links),
-                        "source": state_list.index(state),
-                        "target": state_list.index(next_state_coop),
-                        "label": "C",
+                        "id": len(edges),
+                        "source": state_index[state],
+                        "target": state_index[next_state],
+                        "label": label,
                     }
                 )
-                links.append(
-                    {
-                        "id": len(links),
-                        "source": state_list.index(state),
-                        "target": state_list.index(next_state_def),
-                        "label": "D",
-                    }
-                )
-        json_data = "{nodes: ["
-        for node in nodes:
-            json_data += "{"
-            for key in node:
-                json_data += "{}: {}, ".format(key, format_json(node[key]))
-            json_data = json_data[:-2] + "}, "
-        json_data = json_data[:-2] + "], edges: ["
-        for link in links:
-            json_data += "{"
-            for key in link:
-                json_data += "{}: {}, ".format(key, format_json(link[key]))
-            json_data = json_data[:-2] + "}, "
-        json_data = json_data[:-2] + "]}"
-        return json_data
+        return {"nodes": nodes, "edges": edges}
+
+    def json_data(self):
+        """Returns the graph of the automaton (see graph_data) as a JSON string."""
+        return json.dumps(self.graph_data())
 
     def __str__(self):
         res = "Init: {}\n".format(self.initial_state)
@@ -201,29 +233,195 @@ class MooreMachine:
         return res
 
 
-def format_json(x):
-    try:
-        y = int(x)
-        if y == x:
-            return int(x)
-        return x
-    except ValueError:
-        return '"' + str(x).strip() + '"'
+class CompiledMooreMachine:
+    """Compact representation of a MooreMachine in which states are numbered 0, 1, ... The
+    transitions are stored in an array such that transitions[2 * s + i] is the state reached
+    from state s when reading the input i (0 for "C" and 1 for "D"), and outputs[s] is the
+    output of state s (0 for "C" and 1 for "D")."""
+
+    __slots__ = ("initial_state", "transitions", "outputs")
+
+    def __init__(self, initial_state, transitions, outputs):
+        self.initial_state = initial_state
+        self.transitions = transitions
+        self.outputs = outputs
+
+    @classmethod
+    def from_moore_machine(cls, automata):
+        state_index = {state: i for i, state in enumerate(automata.transitions)}
+        # Unsigned short items only hold state indices up to 65535
+        transitions = array("H" if len(state_index) <= 0x10000 else "L")
+        outputs = bytearray()
+        for state, transition in automata.transitions.items():
+            transitions.append(state_index[transition["C"]])
+            transitions.append(state_index[transition["D"]])
+            outputs.append(SYMBOL_INDEX[automata.outcome[state]])
+        return cls(state_index[automata.initial_state], transitions, bytes(outputs))
+
+    def as_tuple(self):
+        """Returns the automaton as a tuple of plain Python objects that can be sent to
+        another process."""
+        return self.initial_state, self.transitions, self.outputs
+
+    @classmethod
+    def from_tuple(cls, data):
+        """Builds an automaton from a tuple returned by as_tuple()."""
+        return cls(*data)
+
+    def number_states(self):
+        return len(self.outputs)
+
+
+def fight_payoffs(automata1, automata2, rounds, payoffs):
+    """Computes the total payoffs of the two automata when playing against one another for
+    each number of rounds in `rounds`. The automata can be given either as MooreMachine or as
+    CompiledMooreMachine, the latter being faster when the same automata play several times.
+    The pair of automata is only simulated until the joint state repeats itself: from then on,
+    the play is periodic and the payoffs for any number of rounds can be computed from the sums
+    over the prefix and the cycle. Returns a list of pairs (score1, score2), one for each number
+    of rounds, in the same order as `rounds`."""
+    if isinstance(automata1, MooreMachine):
+        automata1 = automata1.compile()
+    if isinstance(automata2, MooreMachine):
+        automata2 = automata2.compile()
+    transitions1 = automata1.transitions
+    transitions2 = automata2.transitions
+    outputs1 = automata1.outputs
+    outputs2 = automata2.outputs
+    num_states2 = len(outputs2)
+    # Payoffs indexed by 2 * outcome1 + outcome2
+    payoffs1 = [payoffs[(o1, o2)][0] for o1 in SYMBOLS for o2 in SYMBOLS]
+    payoffs2 = [payoffs[(o1, o2)][1] for o1 in SYMBOLS for o2 in SYMBOLS]
+    max_rounds = max(rounds, default=0)
+
+    state1 = automata1.initial_state
+    state2 = automata2.initial_state
+    # Cumulative payoffs: prefix1[t] is the payoff of automata1 over the first t rounds
+    prefix1 = [0]
+    prefix2 = [0]
+    first_seen = {}
+    cycle_start = None
+    while len(prefix1) <= max_rounds:
+        joint_state = state1 * num_states2 + state2
+        if joint_state in first_seen:
+            cycle_start = first_seen[joint_state]
+            break
+        first_seen[joint_state] = len(prefix1) - 1
+        outcome1 = outputs1[state1]
+        outcome2 = outputs2[state2]
+        prefix1.append(prefix1[-1] + payoffs1[2 * outcome1 + outcome2])
+        prefix2.append(prefix2[-1] + payoffs2[2 * outcome1 + outcome2])
+        state1 = transitions1[2 * state1 + outcome2]
+        state2 = transitions2[2 * state2 + outcome1]
+
+    simulated_rounds = len(prefix1) - 1
+    res = []
+    for number_rounds in rounds:
+        if number_rounds <= simulated_rounds:
+            res.append((prefix1[number_rounds], prefix2[number_rounds]))
+        else:
+            cycle_length = simulated_rounds - cycle_start
+            num_cycles, remainder = divmod(number_rounds - cycle_start, cycle_length)
+            end = cycle_start + remainder
+            res.append(
+                (
+                    prefix1[end] + num_cycles * (prefix1[-1] - prefix1[cycle_start]),
+                    prefix2[end] + num_cycles * (prefix2[-1] - prefix2[cycle_start]),
+                )
+            )
+    return res
+
+
+_worker_automatas = None
+
+
+def init_pairs_worker(automatas_data):
+    """Initialiser of the worker processes used by play_pairs_chunk: rebuilds once and for all
+    the compiled automata from their tuple representation."""
+    global _worker_automatas
+    _worker_automatas = [
+        CompiledMooreMachine.from_tuple(data) for data in automatas_data
+    ]
+
+
+def play_pairs_chunk(pairs, rounds, payoffs):
+    """Plays all the pairs (i, j) of automata (indices refer to the automata given to
+    init_pairs_worker) and returns a list of triples (i, j, scores) with scores as returned by
+    fight_payoffs."""
+    return [
+        (
+            i,
+            j,
+            fight_payoffs(_worker_automatas[i], _worker_automatas[j], rounds, payoffs),
+        )
+        for i, j in pairs
+    ]
+
+
+def compile_automata(automatas):
+    """Compiles a collection of automata into integer arrays that can be used for batch
+    simulation. All the states of all the automata are numbered consecutively. Returns the
+    transition array (of shape (number of states, 2), column 0 for "C" and 1 for "D"), the
+    output array (0 for "C" and 1 for "D"), and the index of the initial state of each
+    automaton."""
+    transitions = []
+    outputs = []
+    initial_states = []
+    for automata in automatas:
+        offset = len(outputs)
+        state_index = {
+            state: offset + i for i, state in enumerate(automata.transitions)
+        }
+        for state, transition in automata.transitions.items():
+            transitions.append(
+                (state_index[transition["C"]], state_index[transition["D"]])
+            )
+            outputs.append(SYMBOL_INDEX[automata.outcome[state]])
+        initial_states.append(state_index[automata.initial_state])
+    return (
+        np.array(transitions, dtype=np.int64).reshape(-1, 2),
+        np.array(outputs, dtype=np.int64),
+        np.array(initial_states, dtype=np.int64),
+    )
 
 
-def fight(automata1, automata2, number_rounds):
-    automata1.current_state = automata1.initial_state
-    automata2.current_state = automata2.initial_state
+def batch_fight_payoffs(automatas, rounds, payoffs):
+    """Simulates all pairs of distinct automata at once, one round at a time, using NumPy
+    arrays. Returns an array `scores` of shape (number of automata, number of automata,
+    len(rounds)) such that scores[i, j, k] is the total payoff of automata i when playing
+    against automata j for rounds[k] rounds. The diagonal is left to 0."""
+    num_automata = len(automatas)
+    scores = np.zeros((num_automata, num_automata, len(rounds)))
+    if num_automata < 2 or not rounds:
+        return scores
 
-    outcomes1 = []
-    outcomes2 = []
+    transitions, outputs, initial_states = compile_automata(automatas)
+    payoff_matrix = np.array(
+        [
+            [payoffs[("C", "C")], payoffs[("C", "D")]],
+            [payoffs[("D", "C")], payoffs[("D", "D")]],
+        ]
+    )
+    payoff_matrix1 = payoff_matrix[:, :, 0]
+    payoff_matrix2 = payoff_matrix[:, :, 1]
 
-    for round_index in range(number_rounds):
-        outcome1 = automata1.outcome[automata1.current_state]
-        outcome2 = automata2.outcome[automata2.current_state]
-        outcomes1.append(outcome1)
-        outcomes2.append(outcome2)
+    index1, index2 = np.triu_indices(num_automata, k=1)
+    states1 = initial_states[index1]
+    states2 = initial_states[index2]
+    total1 = np.zeros(len(index1))
+    total2 = np.zeros(len(index1))
 
-        automata1.transition(outcome2)
-        automata2.transition(outcome1)
-    return outcomes1, outcomes2
+    round_positions = {}
+    for k, number_rounds in enumerate(rounds):
+        round_positions.setdefault(number_rounds, []).append(k)
+    for round_index in range(1, max(rounds) + 1):
+        outcomes1 = outputs[states1]
+        outcomes2 = outputs[states2]
+        total1 += payoff_matrix1[outcomes1, outcomes2]
+        total2 += payoff_matrix2[outcomes1, outcomes2]
+        states1 = transitions[states1, outcomes2]
+        states2 = transitions[states2, outcomes1]
+        for k in round_positions.get(round_index, []):
+            scores[index1, index2, k] = total1
+            scores[index2, index1, k] = total2
+    return scores
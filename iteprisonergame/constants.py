@@ -0,0 +1,2 @@
+# Answers with at least that many states are not displayed as graphs
+MAX_NUM_STATES_GRAPH = 250
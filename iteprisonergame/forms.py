@@ -106,26 +106,13 @@ class SubmitAnswerForm(forms.Form):
                 if connectivity_error:
                     raise forms.ValidationError(connectivity_error)
             if self.game.itepris_setting.forbidden_strategies:
-                forbidden_strategies = []
-                current_strategy = []
-                for line in self.game.itepris_setting.forbidden_strategies.split("\n"):
-                    line = line.strip()
-                    if len(line) > 0:
-                        if line.startswith("---"):
-                            forbidden_strategies.append(current_strategy)
-                            current_strategy = []
-                        else:
-                            current_strategy.append(line)
-                if current_strategy:
-                    forbidden_strategies.append(current_strategy)
-                for s in forbidden_strategies:
-                    m = MooreMachine()
-                    m.parse(s)
-                    m.initial_state = s[0].split(":")[0].strip()
-                    if m.is_isomorphic(self.moore_machine):
-                        raise forms.ValidationError(
-                            "The admin of this session has forbidden this "
-                            "strategy, please submit another one."
-                        )
+                forbidden_hashes = (
+                    self.game.itepris_setting.get_forbidden_strategies_hashes()
+                )
+                if self.moore_machine.canonical_hash() in forbidden_hashes:
+                    raise forms.ValidationError(
+                        "The admin of this session has forbidden this "
+                        "strategy, please submit another one."
+                    )
 
         return cleaned_data
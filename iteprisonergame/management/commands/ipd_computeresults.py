@@ -1,9 +1,127 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 from core.models import Session, Game
+from core.utils import StreamingBulkCreate, StreamingBulkUpdate
 from iteprisonergame.apps import NAME
-from iteprisonergame.automata import MooreMachine, fight
-from iteprisonergame.models import Answer, Score
+from iteprisonergame.automata import (
+    MooreMachine,
+    fight_payoffs,
+    batch_fight_payoffs,
+    init_pairs_worker,
+    play_pairs_chunk,
+)
+from iteprisonergame.models import Answer, Result, Score, ScoreMatrix
+
+# Fields of the Score rows, in the order used by score_rows()
+SCORE_FIELDS = (
+    "answer_id",
+    "opponent_id",
+    "number_round",
+    "answer_avg_score",
+    "opp_avg_score",
+)
+
+
+def answer_automata(answer):
+    """Builds the automaton of an answer. The answers have been validated upon submission so
+    we do not check the syntax again here."""
+    automata = MooreMachine()
+    automata.initial_state = answer.initial_state.strip()
+    for line in answer.automata.strip().split("\n"):
+        state, transition = line.strip().split(":")
+        state = state.strip()
+        action, next_state_coop, next_state_def = transition.strip().split(",")
+        automata.add_transition(state, "C", next_state_coop.strip())
+        automata.add_transition(state, "D", next_state_def.strip())
+        automata.add_outcome(state, action.strip())
+    return automata
+
+
+def ipd_rounds_and_payoffs(setting):
+    """Returns the list of numbers of rounds and the payoff dictionary of a game setting."""
+    ipd_rounds = [int(r) for r in setting.num_repetitions.split(",") if r]
+    payoffs = {
+        ("C", "C"): (setting.payoff_medium, setting.payoff_medium),
+        ("C", "D"): (setting.payoff_low, setting.payoff_high),
+        ("D", "C"): (setting.payoff_high, setting.payoff_low),
+        ("D", "D"): (setting.payoff_tiny, setting.payoff_tiny),
+    }
+    return ipd_rounds, payoffs
+
+
+def setting_signature(setting):
+    """String identifying the parameters the results have been computed with."""
+    ipd_rounds, payoffs = ipd_rounds_and_payoffs(setting)
+    return "{}|{}|{}|{}".format(
+        ",".join(str(r) for r in ipd_rounds),
+        ",".join(str(payoffs[k]) for k in sorted(payoffs)),
+        setting.store_scores,
+        setting.store_scores_as_matrix,
+    )
+
+
+def score_rows(answer, opponent, round_number, score1, score2):
+    """Returns the two Score rows (as tuples of values for SCORE_FIELDS) for a pair of answers
+    that have played for round_number rounds with total payoffs score1 and score2."""
+    return (
+        (
+            answer.pk,
+            opponent.pk,
+            round_number,
+            score1 / round_number,
+            score2 / round_number,
+        ),
+        (
+            opponent.pk,
+            answer.pk,
+            round_number,
+            score2 / round_number,
+            score1 / round_number,
+        ),
+    )
+
+
+def save_score_matrices(game, answer_ids, ipd_rounds, score_matrices):
+    """Replaces the score matrices of the game. score_matrices[k] is the matrix of average
+    scores for ipd_rounds[k] rounds, its rows and columns following answer_ids."""
+    ScoreMatrix.objects.filter(game=game).delete()
+    ScoreMatrix.objects.bulk_create(
+        ScoreMatrix(
+            game=game,
+            number_round=round_number,
+            data=ScoreMatrix.encode(answer_ids, score_matrices[k]),
+        )
+        for k, round_number in enumerate(ipd_rounds)
+    )
+
+
+def save_total_scores(game, total_scores, ipd_rounds):
+    """Saves the total scores of the answers (a dictionary mapping answers to total scores),
+    together with their average score and the winners. The game result is also updated so
+    that it can be used for incremental updates."""
+    best_score = max(total_scores.values(), default=None)
+    normaliser = sum(ipd_rounds) * max(1, len(total_scores) - 1)
+    with StreamingBulkUpdate(Answer) as answer_writer:
+        for answer, score in total_scores.items():
+            answer_writer.update(
+                answer,
+                total_score=score,
+                avg_score=score / normaliser,
+                winner=score == best_score,
+            )
+    Result.objects.update_or_create(
+        game=game,
+        defaults={
+            "num_answers": len(total_scores),
+            "setting_signature": setting_signature(game.itepris_setting),
+        },
+    )
 
 
 class Command(BaseCommand):
@@ -12,6 +130,28 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--session", type=str, required=True)
         parser.add_argument("--game", type=str, required=True)
+        parser.add_argument(
+            "--backend",
+            type=str,
+            choices=["cycle", "numpy"],
+            default="cycle",
+            help="How the pairs of strategies are played: 'cycle' plays each pair until their "
+            "joint state repeats, 'numpy' plays all pairs at once round by round.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=getattr(settings, "IPD_COMPUTE_WORKERS", 1),
+            help="Number of processes used to play the pairs of strategies (only used with the "
+            "cycle backend). Defaults to the IPD_COMPUTE_WORKERS setting if defined, 1 "
+            "otherwise.",
+        )
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=10000,
+            help="Number of pairwise scores written to the database at once.",
+        )
 
     def handle(self, IP_NAME=None, *args, **options):
         if not options["session"]:
@@ -44,99 +184,134 @@ class Command(BaseCommand):
             return
         game = game.first()
 
-        ans_automatas = []
-        for answer in Answer.objects.filter(game=game):
-            automata = MooreMachine()
-            automata.initial_state = answer.initial_state.strip()
-            for line in answer.automata.strip().split("\n"):
-                state, transition = line.strip().split(":")
-                state = state.strip()
-                action, next_state_coop, next_state_def = transition.strip().split(",")
-                automata.add_transition(state, "C", next_state_coop.strip())
-                automata.add_transition(state, "D", next_state_def.strip())
-                automata.add_outcome(state, action.strip())
-            ans_automatas.append((answer, automata))
-
-        ipd_rounds = game.itepris_setting.num_repetitions
-        ipd_rounds = [int(r) for r in ipd_rounds.split(",") if r]
-        payoffs = {
-            ("C", "C"): (
-                game.itepris_setting.payoff_medium,
-                game.itepris_setting.payoff_medium,
-            ),
-            ("C", "D"): (
-                game.itepris_setting.payoff_low,
-                game.itepris_setting.payoff_high,
-            ),
-            ("D", "C"): (
-                game.itepris_setting.payoff_high,
-                game.itepris_setting.payoff_low,
-            ),
-            ("D", "D"): (
-                game.itepris_setting.payoff_tiny,
-                game.itepris_setting.payoff_tiny,
-            ),
-        }
-
-        Score.objects.filter(answer__game=game).delete()
-
-        all_scores = []
+        ans_automatas = [
+            (answer, answer_automata(answer))
+            for answer in Answer.objects.filter(game=game)
+        ]
+        ipd_rounds, payoffs = ipd_rounds_and_payoffs(game.itepris_setting)
+
+        # Answers with equivalent automata score the same, so only one representative (the
+        # minimal automaton) per canonical form plays.
+        class_index = {}
+        representatives = []
+        answer_classes = []
+        for _, automata in ans_automatas:
+            minimal = automata.minimize()
+            canonical_hash = minimal.canonical_hash(is_minimal=True)
+            if canonical_hash not in class_index:
+                class_index[canonical_hash] = len(representatives)
+                representatives.append(minimal)
+            answer_classes.append(class_index[canonical_hash])
+        compiled_representatives = [automata.compile() for automata in representatives]
+
+        if options["backend"] == "numpy":
+            batch_scores = batch_fight_payoffs(representatives, ipd_rounds, payoffs)
+            class_pair_scores = (
+                (i, j, zip(batch_scores[i, j].tolist(), batch_scores[j, i].tolist()))
+                for i in range(len(representatives))
+                for j in range(i + 1, len(representatives))
+            )
+        elif options["workers"] > 1:
+            class_pair_scores = self.parallel_pair_scores(
+                compiled_representatives, ipd_rounds, payoffs, options["workers"]
+            )
+        else:
+            class_pair_scores = (
+                (
+                    i,
+                    j,
+                    fight_payoffs(
+                        compiled_representatives[i],
+                        compiled_representatives[j],
+                        ipd_rounds,
+                        payoffs,
+                    ),
+                )
+                for i in range(len(representatives))
+                for j in range(i + 1, len(representatives))
+            )
+        class_scores = {}
+        for i, j, pair_scores in class_pair_scores:
+            pair_scores = list(pair_scores)
+            class_scores[(i, j)] = pair_scores
+            class_scores[(j, i)] = [(score2, score1) for score1, score2 in pair_scores]
+        # Strategies facing an equivalent one
+        for i, class_size in Counter(answer_classes).items():
+            if class_size > 1:
+                class_scores[(i, i)] = fight_payoffs(
+                    compiled_representatives[i],
+                    compiled_representatives[i],
+                    ipd_rounds,
+                    payoffs,
+                )
+        all_pair_scores = (
+            (i, j, class_scores[(answer_classes[i], answer_classes[j])])
+            for i in range(len(ans_automatas))
+            for j in range(i + 1, len(ans_automatas))
+        )
+
         store_pairwise_scores = game.itepris_setting.store_scores
-        total_scores = {answer: 0 for answer, _ in ans_automatas}
-        for i in range(len(ans_automatas)):
-            answer, ans_automata = ans_automatas[i]
-            for j in range(i + 1, len(ans_automatas)):
-                opponent, opp_automata = ans_automatas[j]
-                for round_number in ipd_rounds:
-                    outcomes_ans, outcomes_opp = fight(
-                        ans_automata, opp_automata, round_number
-                    )
-                    score1 = 0
-                    score2 = 0
-                    for round_index in range(round_number):
-                        s1, s2 = payoffs[
-                            (outcomes_ans[round_index], outcomes_opp[round_index])
-                        ]
-                        score1 += s1
-                        score2 += s2
-                    total_scores[answer] += score1
-                    total_scores[opponent] += score2
-                    if store_pairwise_scores:
-                        all_scores.append(
-                            Score(
-                                answer=answer,
-                                opponent=opponent,
-                                number_round=round_number,
-                                answer_avg_score=score1 / round_number,
-                                opp_avg_score=score2 / round_number,
-                            )
-                        )
-                        all_scores.append(
-                            Score(
-                                answer=opponent,
-                                opponent=answer,
-                                number_round=round_number,
-                                answer_avg_score=score2 / round_number,
-                                opp_avg_score=score1 / round_number,
-                            )
-                        )
-        if store_pairwise_scores:
-            Score.objects.bulk_create(all_scores)
-
-        best_answer = None
-        best_score = None
-        for answer, score in total_scores.items():
-            answer.avg_score = score / (
-                sum(ipd_rounds) * (max(1, len(ans_automatas) - 1))
+        store_as_matrix = (
+            store_pairwise_scores and game.itepris_setting.store_scores_as_matrix
+        )
+        if store_as_matrix:
+            score_matrices = np.zeros(
+                (len(ipd_rounds), len(ans_automatas), len(ans_automatas))
             )
-            answer.winner = False
-            answer.save()
-            if best_score is None or score > best_score:
-                best_score = score
-                best_answer = [answer]
-            elif score == best_score:
-                best_answer.append(answer)
-        if best_answer:
-            for answer in best_answer:
-                answer.winner = True
-                answer.save()
+        total_scores = {answer: 0 for answer, _ in ans_automatas}
+        with transaction.atomic():
+            Score.objects.filter(answer__game=game).delete()
+            with StreamingBulkCreate(
+                Score, SCORE_FIELDS, batch_size=options["batch_size"]
+            ) as score_writer:
+                for i, j, pair_scores in all_pair_scores:
+                    answer = ans_automatas[i][0]
+                    opponent = ans_automatas[j][0]
+                    for k, (score1, score2) in enumerate(pair_scores):
+                        round_number = ipd_rounds[k]
+                        total_scores[answer] += score1
+                        total_scores[opponent] += score2
+                        if store_as_matrix:
+                            score_matrices[k, i, j] = score1 / round_number
+                            score_matrices[k, j, i] = score2 / round_number
+                        elif store_pairwise_scores:
+                            for row in score_rows(
+                                answer, opponent, round_number, score1, score2
+                            ):
+                                score_writer.add(row)
+            if store_as_matrix:
+                save_score_matrices(
+                    game,
+                    [answer.pk for answer, _ in ans_automatas],
+                    ipd_rounds,
+                    score_matrices,
+                )
+            else:
+                ScoreMatrix.objects.filter(game=game).delete()
+            save_total_scores(game, total_scores, ipd_rounds)
+
+    @staticmethod
+    def parallel_pair_scores(automatas, rounds, payoffs, num_workers):
+        """Plays all the pairs of compiled automata in a pool of processes. The
+        upper-triangular pair space is split into chunks, each worker receiving the automata as
+        plain tuples. Yields the same triples (i, j, scores) as the sequential loop."""
+        pairs = [
+            (i, j) for i in range(len(automatas)) for j in range(i + 1, len(automatas))
+        ]
+        if not pairs:
+            return
+        # A few chunks per worker to balance the load as strategies vary in size
+        chunk_size = max(1, len(pairs) // (num_workers * 4))
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=init_pairs_worker,
+            initargs=([automata.as_tuple() for automata in automatas],),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    play_pairs_chunk, pairs[start : start + chunk_size], rounds, payoffs
+                )
+                for start in range(0, len(pairs), chunk_size)
+            ]
+            for future in futures:
+                yield from future.result()
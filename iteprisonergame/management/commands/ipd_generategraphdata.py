@@ -7,18 +7,38 @@ from iteprisonergame.models import Answer
 
 
 def itepris_graph_data(answer):
-    if answer.number_states() < 100:
+    if answer.displays_graph():
         automata = MooreMachine()
         automata.parse_from_answer(answer)
         return automata.json_data()
 
 
+def render_missing_graphs(answers):
+    """Computes and saves the graph data of the answers that do not have one yet. Graphs are
+    rendered lazily, the first time they are displayed."""
+    updated_answers = []
+    for answer in answers:
+        if answer.graph_json_data is None:
+            json_data = itepris_graph_data(answer)
+            if json_data:
+                answer.graph_json_data = json_data
+                updated_answers.append(answer)
+    if updated_answers:
+        Answer.objects.bulk_update(updated_answers, ["graph_json_data"], batch_size=500)
+
+
 class Command(BaseCommand):
-    help = "Computes the global_results of the IPD."
+    help = "Computes the data used to display the automata of the IPD as graphs."
 
     def add_arguments(self, parser):
         parser.add_argument("--session", type=str, required=True)
         parser.add_argument("--game", type=str, required=True)
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=500,
+            help="Number of answers updated in the database at once.",
+        )
 
     def handle(self, IP_NAME=None, *args, **options):
         if not options["session"]:
@@ -51,8 +71,20 @@ class Command(BaseCommand):
             return
         game = game.first()
 
-        for answer in Answer.objects.filter(game=game):
+        batch_size = options["batch_size"]
+        batch = []
+        answers = (
+            Answer.objects.filter(game=game)
+            .only("id", "automata", "initial_state")
+            .iterator(chunk_size=batch_size)
+        )
+        for answer in answers:
             json_data = itepris_graph_data(answer)
             if json_data:
                 answer.graph_json_data = json_data
-                answer.save()
+                batch.append(answer)
+            if len(batch) >= batch_size:
+                Answer.objects.bulk_update(batch, ["graph_json_data"])
+                batch = []
+        if batch:
+            Answer.objects.bulk_update(batch, ["graph_json_data"])
@@ -0,0 +1,192 @@
+import numpy as np
+from django.core import management
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Session, Game, Player
+from core.utils import StreamingBulkCreate
+from iteprisonergame.apps import NAME
+from iteprisonergame.automata import fight_payoffs
+from iteprisonergame.management.commands.ipd_computeresults import (
+    SCORE_FIELDS,
+    answer_automata,
+    ipd_rounds_and_payoffs,
+    save_score_matrices,
+    save_total_scores,
+    score_rows,
+    setting_signature,
+)
+from iteprisonergame.models import Answer, Result, Score, ScoreMatrix
+
+
+class Command(BaseCommand):
+    help = (
+        "Updates the results of the IPD based on the latest submission: only the new answer "
+        "plays against the existing ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--session", type=str, required=True)
+        parser.add_argument("--game", type=str, required=True)
+        parser.add_argument("--player", type=str, required=True)
+
+    def handle(self, *args, **options):
+        if not options["session"]:
+            self.stderr.write(
+                "ERROR: you need to give the URL tag of a session with the --session argument"
+            )
+            return
+        session = Session.objects.filter(url_tag=options["session"])
+        if not session.exists():
+            self.stderr.write(
+                "ERROR: no session with URL tag {} has been found".format(
+                    options["session"]
+                )
+            )
+            return
+        session = session.first()
+
+        if not options["game"]:
+            self.stderr.write(
+                "ERROR: you need to give the URL tag of a game with the --game argument"
+            )
+            return
+        game = Game.objects.filter(
+            session=session, url_tag=options["game"], game_type=NAME
+        )
+        if not game.exists():
+            self.stderr.write(
+                "ERROR: no game with URL tag {} has been found".format(options["game"])
+            )
+            return
+        game = game.first()
+
+        player = Player.objects.filter(name=options["player"], session=session)
+        if not player.exists():
+            self.stderr.write(
+                "ERROR: no player with name {} has been found".format(options["player"])
+            )
+            return
+        player = player.first()
+
+        if not Answer.objects.filter(game=game, player=player).exists():
+            self.stderr.write(
+                "ERROR: the player {} has not submitted an answer".format(player.name)
+            )
+            return
+
+        ipd_rounds, payoffs = ipd_rounds_and_payoffs(game.itepris_setting)
+        store_pairwise_scores = game.itepris_setting.store_scores
+        store_as_matrix = (
+            store_pairwise_scores and game.itepris_setting.store_scores_as_matrix
+        )
+        with transaction.atomic():
+            # The game result is locked so that concurrent submissions are processed one
+            # after the other, the answers are only read once the lock is held.
+            game_result = Result.objects.select_for_update().filter(game=game).first()
+            new_answer = Answer.objects.get(game=game, player=player)
+            if new_answer.total_score is not None:
+                # The answer has already been taken into account
+                return
+            other_answers = list(
+                Answer.objects.filter(game=game).exclude(pk=new_answer.pk)
+            )
+
+            score_matrices = None
+            if store_as_matrix:
+                score_matrices = {
+                    m.number_round: m for m in ScoreMatrix.objects.filter(game=game)
+                }
+
+            # The running totals can only be used if they are up-to-date, otherwise we fall
+            # back to computing everything from scratch.
+            if (
+                game_result is None
+                or game_result.num_answers != len(other_answers)
+                or game_result.setting_signature
+                != setting_signature(game.itepris_setting)
+                or any(answer.total_score is None for answer in other_answers)
+                or not self.score_matrices_up_to_date(
+                    game, ipd_rounds, other_answers, score_matrices
+                )
+            ):
+                management.call_command(
+                    "ipd_computeresults",
+                    session=session.url_tag,
+                    game=game.url_tag,
+                    stdout=self.stdout,
+                )
+                return
+
+            new_automata = answer_automata(new_answer).compile()
+            total_scores = {answer: answer.total_score for answer in other_answers}
+            total_scores[new_answer] = 0
+            new_scores = []
+            new_pair_scores = {}
+            # Opponents with equivalent automata score the same against the new answer
+            class_scores = {}
+            for opponent in other_answers:
+                opp_automata = answer_automata(opponent).minimize()
+                canonical_hash = opp_automata.canonical_hash(is_minimal=True)
+                if canonical_hash not in class_scores:
+                    class_scores[canonical_hash] = fight_payoffs(
+                        new_automata,
+                        opp_automata.compile(),
+                        ipd_rounds,
+                        payoffs,
+                    )
+                pair_scores = class_scores[canonical_hash]
+                new_pair_scores[opponent.pk] = pair_scores
+                for round_number, (score1, score2) in zip(ipd_rounds, pair_scores):
+                    total_scores[new_answer] += score1
+                    total_scores[opponent] += score2
+                    if store_pairwise_scores and not store_as_matrix:
+                        new_scores.extend(
+                            score_rows(
+                                new_answer, opponent, round_number, score1, score2
+                            )
+                        )
+
+            if store_as_matrix:
+                self.extend_score_matrices(
+                    game, ipd_rounds, new_answer, new_pair_scores, score_matrices
+                )
+            elif store_pairwise_scores:
+                with StreamingBulkCreate(Score, SCORE_FIELDS) as score_writer:
+                    for row in new_scores:
+                        score_writer.add(row)
+            save_total_scores(game, total_scores, ipd_rounds)
+
+    @staticmethod
+    def score_matrices_up_to_date(game, ipd_rounds, answers, score_matrices):
+        """Checks that the stored score matrices, if used, cover exactly the given answers."""
+        if score_matrices is None:
+            return True
+        answer_ids = {answer.pk for answer in answers}
+        for round_number in ipd_rounds:
+            if round_number not in score_matrices:
+                return False
+            if set(score_matrices[round_number].decode()[0].tolist()) != answer_ids:
+                return False
+        return True
+
+    @staticmethod
+    def extend_score_matrices(
+        game, ipd_rounds, new_answer, new_pair_scores, score_matrices
+    ):
+        """Adds a row and a column for the new answer to the score matrices."""
+        answer_ids = None
+        extended_matrices = []
+        for k, round_number in enumerate(ipd_rounds):
+            old_answer_ids, old_scores = score_matrices[round_number].decode()
+            if answer_ids is None:
+                answer_ids = old_answer_ids.tolist() + [new_answer.pk]
+            num_old = len(old_answer_ids)
+            scores = np.zeros((num_old + 1, num_old + 1))
+            scores[:num_old, :num_old] = old_scores
+            for i, opponent_id in enumerate(old_answer_ids.tolist()):
+                score1, score2 = new_pair_scores[opponent_id][k]
+                scores[num_old, i] = score1 / round_number
+                scores[i, num_old] = score2 / round_number
+            extended_matrices.append(scores)
+        save_score_matrices(game, answer_ids, ipd_rounds, extended_matrices)
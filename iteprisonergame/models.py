@@ -1,6 +1,38 @@
+from io import BytesIO
+
+import numpy as np
+from django.core.exceptions import FieldDoesNotExist
 from django.db import models
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
 
 from core.models import Player, Game
+from iteprisonergame.automata import MooreMachine
+from iteprisonergame.constants import MAX_NUM_STATES_GRAPH
+
+
+def forbidden_strategies_hashes(forbidden_strategies):
+    """Returns the canonical hashes of the forbidden strategies, one per line. The initial
+    state of a forbidden strategy is the first state it describes. Strategies that cannot be
+    parsed are ignored, the setting form rejects them anyway."""
+    if not forbidden_strategies:
+        return ""
+    hashes = []
+    current_strategy = []
+    for line in forbidden_strategies.split("\n") + ["---"]:
+        line = line.strip()
+        if line.startswith("---"):
+            if current_strategy:
+                automata = MooreMachine()
+                errors = automata.parse(current_strategy)
+                if not errors and not automata.test_validity(["C", "D"]):
+                    initial_state = current_strategy[0].split(":")[0]
+                    automata.initial_state = initial_state.strip()
+                    hashes.append(automata.canonical_hash())
+                current_strategy = []
+        elif len(line) > 0:
+            current_strategy.append(line)
+    return "\n".join(hashes)
 
 
 class Setting(models.Model):
@@ -19,6 +51,12 @@ class Setting(models.Model):
                   "and every round). For large number of answers there will be many such scores, "
                   "it can then be good to de-activate this."
     )
+    store_scores_as_matrix = models.BooleanField(
+        default=False,
+        help_text="If selected (and the non-aggregated scores are stored), the scores are stored "
+                  "as one compressed matrix per number of rounds instead of one database entry "
+                  "per pair of answers. This is much more efficient for large number of answers."
+    )
     payoff_high = models.FloatField(
         default=0,
         help_text="Payoff of the defecting player when one player defects and the other cooperates.",
@@ -39,10 +77,32 @@ class Setting(models.Model):
         null=True,
         help_text="Specify here a list of forbidden strategies. Specify the strategies by using "
         "the same syntax as the one used to submit an answer. Separate strategies by "
-        "a line starting with '---'. Forbidden strategies (and isomorphic ones) cannot "
-        "be submitted.",
+        "a line starting with '---'. Forbidden strategies (and equivalent ones, i.e., "
+        "ones that behave the same) cannot be submitted.",
+    )
+    forbidden_strategies_hashes = models.TextField(
+        blank=True, null=True, editable=False
     )
 
+    def save(self, *args, **kwargs):
+        self.forbidden_strategies_hashes = forbidden_strategies_hashes(
+            self.forbidden_strategies
+        )
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "forbidden_strategies" in update_fields:
+            kwargs["update_fields"] = set(update_fields) | {
+                "forbidden_strategies_hashes"
+            }
+        super(Setting, self).save(*args, **kwargs)
+
+    def get_forbidden_strategies_hashes(self):
+        """Returns the set of the canonical hashes of the forbidden strategies. They are
+        only computed, without being stored, if they are missing."""
+        hashes = self.forbidden_strategies_hashes
+        if hashes is None:
+            hashes = forbidden_strategies_hashes(self.forbidden_strategies)
+        return set(hashes.split())
+
 
 class Answer(models.Model):
     game = models.ForeignKey(
@@ -58,6 +118,7 @@ class Answer(models.Model):
     avg_score = models.FloatField(default=0.0, blank=True, null=True)
     winner = models.BooleanField(blank=True, null=True, default=False)
     graph_json_data = models.TextField(blank=True, null=True)
+    total_score = models.FloatField(blank=True, null=True)
     submission_time = models.DateTimeField(auto_now=True)
 
     def formatted_avg_score(self):
@@ -68,6 +129,9 @@ class Answer(models.Model):
     def number_states(self):
         return len(self.automata.split("\n"))
 
+    def displays_graph(self):
+        return self.number_states() < MAX_NUM_STATES_GRAPH
+
     class Meta:
         ordering = ["game", "winner", "player"]
         unique_together = ("game", "player")
@@ -82,6 +146,20 @@ class Answer(models.Model):
         )
 
 
+class Result(models.Model):
+    game = models.OneToOneField(
+        Game, on_delete=models.CASCADE, related_name="itepris_result"
+    )
+    num_answers = models.IntegerField(default=0)
+    setting_signature = models.CharField(max_length=200, blank=True, null=True)
+
+    class Meta:
+        ordering = ["game"]
+
+    def __str__(self):
+        return "{} - Results Data".format(self.game.name)
+
+
 class Score(models.Model):
     answer = models.ForeignKey(Answer, on_delete=models.CASCADE, related_name="scores")
     opponent = models.ForeignKey(
@@ -104,3 +182,95 @@ class Score(models.Model):
             self.opponent.player.name,
             self.answer_avg_score,
         )
+
+
+class ScoreMatrix(models.Model):
+    """Non-aggregated scores of a game for a given number of rounds, stored as a compressed
+    matrix: for the i-th and j-th answer ids, scores[i, j] is the average score of the i-th
+    answer when playing against the j-th one."""
+
+    game = models.ForeignKey(
+        Game, on_delete=models.CASCADE, related_name="itepris_score_matrices"
+    )
+    number_round = models.IntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        ordering = ["game", "number_round"]
+        unique_together = ("game", "number_round")
+
+    def __init__(self, *args, **kwargs):
+        super(ScoreMatrix, self).__init__(*args, **kwargs)
+
+        self.decoded_data = None
+
+    @staticmethod
+    def encode(answer_ids, scores):
+        """Compresses the answer ids and the matrix of average scores into bytes."""
+        buffer = BytesIO()
+        np.savez_compressed(
+            buffer,
+            answer_ids=np.asarray(answer_ids, dtype=np.int64),
+            scores=np.asarray(scores, dtype=np.float64),
+        )
+        return buffer.getvalue()
+
+    def decode(self):
+        """Returns the answer ids and the matrix of average scores. The result is cached."""
+        if self.decoded_data is None:
+            with np.load(BytesIO(bytes(self.data))) as arrays:
+                self.decoded_data = arrays["answer_ids"], arrays["scores"]
+        return self.decoded_data
+
+    def row(self, answer_id):
+        """Returns the list of triples (opponent id, average score of the answer, average score
+        of the opponent) for the answer with the given id."""
+        answer_ids, scores = self.decode()
+        indices = np.flatnonzero(answer_ids == answer_id)
+        if len(indices) == 0:
+            return []
+        i = indices[0]
+        return [
+            (opponent_id, answer_score, opp_score)
+            for j, (opponent_id, answer_score, opp_score) in enumerate(
+                zip(answer_ids.tolist(), scores[i].tolist(), scores[:, i].tolist())
+            )
+            if j != i
+        ]
+
+    def __str__(self):
+        return "[{}] {} - Scores for {} rounds".format(
+            self.game.session, self.game.name, self.number_round
+        )
+
+
+def fill_missing_forbidden_strategies_hashes(apps, using):
+    """Stores the hashes of the forbidden strategies of the settings saved before they
+    were."""
+    setting_model = apps.get_model("iteprisonergame", "Setting")
+    missing_hashes = setting_model.objects.using(using).filter(
+        forbidden_strategies_hashes__isnull=True
+    )
+    for setting_id, forbidden_strategies in missing_hashes.values_list(
+        "id", "forbidden_strategies"
+    ):
+        setting_model.objects.using(using).filter(id=setting_id).update(
+            forbidden_strategies_hashes=forbidden_strategies_hashes(forbidden_strategies)
+        )
+
+
+# The migrations are generated on each deployment, the hashes are thus filled after every
+# migrate instead of in a RunPython step of a shipped migration.
+@receiver(post_migrate, dispatch_uid="itepris_fill_forbidden_strategies_hashes")
+def fill_forbidden_strategies_hashes_after_migrate(
+    sender, app_config, apps, using, **kwargs
+):
+    if app_config.label != "iteprisonergame":
+        return
+    try:
+        apps.get_model("iteprisonergame", "Setting")._meta.get_field(
+            "forbidden_strategies_hashes"
+        )
+    except (LookupError, FieldDoesNotExist):
+        return
+    fill_missing_forbidden_strategies_hashes(apps, using)
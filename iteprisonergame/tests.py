@@ -0,0 +1,162 @@
+from io import StringIO
+
+from django.apps import apps as django_apps
+from django.core import management
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.models import CustomUser, Game, Player, Session
+from iteprisonergame.apps import NAME, URL_NAMESPACE
+from iteprisonergame.automata import MooreMachine
+from iteprisonergame.forms import SubmitAnswerForm
+from iteprisonergame.models import (
+    Answer,
+    Setting,
+    fill_missing_forbidden_strategies_hashes,
+)
+
+AUTOMATA = (
+    "0: C, 0, 0",
+    "0: D, 0, 0",
+    "0: C, 0, 1\n1: D, 0, 1",
+    "0: C, 0, 1\n1: D, 1, 1",
+    "0: D, 1, 0\n1: C, 1, 0",
+    "0: C, 1, 2\n1: D, 2, 0\n2: C, 0, 0",
+)
+
+
+class CompiledMooreMachineTestCase(SimpleTestCase):
+    def test_many_states(self):
+        # A cycle of states that all cooperate except the last one
+        number_states = 70000
+        automata = MooreMachine()
+        automata.initial_state = "0"
+        for state in range(number_states):
+            next_state = str((state + 1) % number_states)
+            automata.add_transition(str(state), "C", next_state)
+            automata.add_transition(str(state), "D", next_state)
+            automata.add_outcome(str(state), "D" if state == number_states - 1 else "C")
+        compiled = automata.compile()
+        self.assertEqual(compiled.number_states(), number_states)
+        self.assertEqual(
+            compiled.transitions[2 * (number_states - 2)], number_states - 1
+        )
+        self.assertEqual(compiled.transitions[2 * (number_states - 1)], 0)
+
+
+class ForbiddenStrategiesTestCase(TestCase):
+    def setUp(self):
+        session = Session.objects.create(url_tag="session", name="session")
+        self.game = Game.objects.create(
+            session=session, game_type=NAME, name="IPD", url_tag="ipd"
+        )
+        user = CustomUser.objects.create(username="player", is_player=True)
+        self.player = Player.objects.create(user=user, name="player", session=session)
+        self.setting = Setting.objects.create(
+            game=self.game,
+            forbidden_strategies="0: D, 0, 0\n---\n0: C, 0, 1\n1: D, 1, 1",
+        )
+
+    def is_accepted(self, automata, initial_state="a"):
+        form = SubmitAnswerForm(
+            {
+                "name": "strategy",
+                "initial_state": initial_state,
+                "automata": automata,
+                "motivation": "",
+            },
+            game=Game.objects.get(pk=self.game.pk),
+            player=self.player,
+        )
+        return form.is_valid()
+
+    def test_equivalent_strategies_are_rejected(self):
+        self.assertEqual(len(self.setting.forbidden_strategies_hashes.split()), 2)
+        self.assertFalse(self.is_accepted("a: D, b, b\nb: D, a, a"))
+        self.assertFalse(self.is_accepted("a: C, a, b\nb: D, b, b"))
+        self.assertTrue(self.is_accepted("a: C, a, a"))
+
+    def test_missing_hashes(self):
+        Setting.objects.filter(pk=self.setting.pk).update(
+            forbidden_strategies_hashes=None
+        )
+        # The hashes are computed but not stored when validating an answer
+        self.assertFalse(self.is_accepted("a: D, a, a"))
+        self.setting.refresh_from_db()
+        self.assertIsNone(self.setting.forbidden_strategies_hashes)
+        # They are stored after migrating
+        fill_missing_forbidden_strategies_hashes(django_apps, "default")
+        self.setting.refresh_from_db()
+        self.assertEqual(len(self.setting.forbidden_strategies_hashes.split()), 2)
+
+
+class ResultsQueryCountTestCase(TestCase):
+    """The number of queries run by the results page should not depend on the number of
+    answers."""
+
+    def setUp(self):
+        self.session = Session.objects.create(
+            url_tag="session", name="session", long_name="Session", visible=True
+        )
+        self.game = Game.objects.create(
+            session=self.session,
+            game_type=NAME,
+            name="IPD",
+            url_tag="ipd",
+            visible=True,
+            results_visible=True,
+        )
+        self.setting = Setting.objects.create(game=self.game, store_scores=True)
+        self.admin = CustomUser.objects.create(username="admin", is_staff=True)
+        self.session.admins.add(self.admin)
+        self.client.force_login(self.admin)
+        self.url = reverse(
+            URL_NAMESPACE + ":global_results",
+            kwargs={"session_url_tag": "session", "game_url_tag": "ipd"},
+        )
+        self.num_answers = 0
+
+    def add_answers(self, num_answers):
+        for _ in range(num_answers):
+            name = "player{}".format(self.num_answers)
+            user = CustomUser.objects.create(username=name, is_player=True)
+            player = Player.objects.create(user=user, name=name, session=self.session)
+            Answer.objects.create(
+                game=self.game,
+                player=player,
+                name=name,
+                automata=AUTOMATA[self.num_answers % len(AUTOMATA)],
+                initial_state="0",
+                motivation="",
+            )
+            self.num_answers += 1
+        management.call_command(
+            "ipd_computeresults", session="session", game="ipd", stdout=StringIO()
+        )
+        # The graphs of the automata are rendered when the page is first displayed
+        self.client.get(self.url)
+
+    def results_page_num_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assert_constant_num_queries(self):
+        self.add_answers(2)
+        num_queries = self.results_page_num_queries()
+        self.assertLessEqual(num_queries, 20)
+        self.add_answers(10)
+        with self.assertNumQueries(num_queries):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_score_rows(self):
+        self.assert_constant_num_queries()
+
+    def test_score_matrices(self):
+        self.setting.store_scores_as_matrix = True
+        self.setting.save()
+        self.assert_constant_num_queries()
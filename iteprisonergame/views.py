@@ -1,17 +1,21 @@
 import csv
 import os
+from collections import namedtuple
 
+from django.db.models import Prefetch
 from django.http import HttpResponse
 from django.shortcuts import render
 
 from core.game_views import GameIndexView, GameSubmitAnswerView, GameResultsView
 from .forms import SubmitAnswerForm
-from .management.commands.ipd_generategraphdata import itepris_graph_data
-from .models import Answer
+from .management.commands.ipd_generategraphdata import render_missing_graphs
+from .models import Answer, Score, ScoreMatrix
 
 
 class Index(GameIndexView):
     def get(self, request, session_url_tag, game_url_tag):
+        if self.context["answer"]:
+            render_missing_graphs([self.context["answer"]])
         return render(
             request, os.path.join("iteprisonergame", "index.html"), self.context
         )
@@ -44,8 +48,6 @@ class SubmitAnswer(GameSubmitAnswerView):
             motivation=form_object.cleaned_data["motivation"],
             name=form_object.cleaned_data["name"],
         )
-        new_answer.graph_json_data = itepris_graph_data(new_answer)
-        new_answer.save()
         self.context["submitted_answer"] = new_answer
 
     def post_code_if_form_invalid(self, request, form_object):
@@ -57,11 +59,77 @@ class SubmitAnswer(GameSubmitAnswerView):
         )
 
 
+PairwiseScore = namedtuple(
+    "PairwiseScore", ("opponent", "number_round", "answer_avg_score", "opp_avg_score")
+)
+
+
+def matrix_pairwise_scores(answer, score_matrices, answers_by_id, opponent_rank):
+    """Generator of the pairwise scores of an answer, read from the score matrices of the
+    game when it is iterated over. The scores are PairwiseScore tuples, in the same order as
+    for the Score model, i.e., following the default ordering of the answers."""
+    rows = []
+    for score_matrix in score_matrices:
+        for opponent_id, answer_score, opp_score in score_matrix.row(answer.pk):
+            if opponent_id in answers_by_id:
+                rows.append(
+                    (
+                        opponent_rank[opponent_id],
+                        score_matrix.number_round,
+                        opponent_id,
+                        answer_score,
+                        opp_score,
+                    )
+                )
+    rows.sort()
+    for _, number_round, opponent_id, answer_score, opp_score in rows:
+        yield PairwiseScore(
+            answers_by_id[opponent_id], number_round, answer_score, opp_score
+        )
+
+
 class Results(GameResultsView):
     def get(self, request, session_url_tag, game_url_tag):
         context = self.context
-        all_answers = Answer.objects.filter(game=self.game)
-        context["answers"] = all_answers.order_by("name")
-        context["answers_sorted_score"] = all_answers.order_by("-avg_score")
-        context["display_pairwise_scores"] = self.game.itepris_setting.store_scores
+        setting = self.game.itepris_setting
+        # Everything the template needs is fetched here so that the number of queries does not
+        # depend on the number of answers.
+        all_answers = (
+            Answer.objects.filter(game=self.game)
+            .select_related("player__represented_team")
+            .prefetch_related("player__represented_team__players")
+        )
+        if setting.store_scores and not setting.store_scores_as_matrix:
+            all_answers = all_answers.prefetch_related(
+                Prefetch("scores", queryset=Score.objects.select_related("opponent"))
+            )
+        answers = list(all_answers.order_by("name"))
+        render_missing_graphs(answers)
+        if setting.store_scores:
+            if setting.store_scores_as_matrix:
+                score_matrices = list(ScoreMatrix.objects.filter(game=self.game))
+                answers_by_id = {answer.pk: answer for answer in answers}
+                opponent_rank = {
+                    answer_id: rank
+                    for rank, answer_id in enumerate(
+                        Answer.objects.filter(game=self.game).values_list(
+                            "pk", flat=True
+                        )
+                    )
+                }
+                for answer in answers:
+                    answer.pairwise_scores = matrix_pairwise_scores(
+                        answer, score_matrices, answers_by_id, opponent_rank
+                    )
+            else:
+                for answer in answers:
+                    answer.pairwise_scores = answer.scores.all()
+        context["answers"] = answers
+        # Answers without a score come last
+        context["answers_sorted_score"] = sorted(
+            answers,
+            key=lambda answer: (answer.avg_score is not None, answer.avg_score or 0),
+            reverse=True,
+        )
+        context["display_pairwise_scores"] = setting.store_scores
         return render(request, os.path.join("iteprisonergame", "results.html"), context)
@@ -18,6 +18,7 @@ class NumbersGameConfig(GameConfig):
             URL_TAG,
             URL_NAMESPACE,
             management_commands="numbersgame_results",
+            update_management_commands="numbersgame_updateresults",
             answer_model_fields=("answer", "motivation"),
             illustration_paths=(
                 "numbersgame/img/NumbersGame1.png",
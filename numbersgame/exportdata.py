@@ -1,6 +1,6 @@
 import csv
 
-from numbersgame.models import Answer, Setting
+from numbersgame.models import Answer, Result, Setting
 
 
 def answers_to_csv(writer, game):
@@ -16,14 +16,22 @@ def answers_to_csv(writer, game):
             "submission_time",
         ]
     )
+    corrected_average = (
+        Result.objects.filter(game=game)
+        .values_list("corrected_average", flat=True)
+        .first()
+    )
     for answer in Answer.objects.filter(game=game):
+        gap = None
+        if corrected_average is not None and answer.answer is not None:
+            gap = abs(answer.answer - corrected_average)
         writer.writerow(
             [
                 answer.player.name,
                 answer.player.is_team_player,
                 answer.answer,
                 answer.motivation,
-                answer.gap,
+                gap,
                 answer.winner,
                 answer.submission_time,
             ]
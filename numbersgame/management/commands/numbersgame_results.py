@@ -1,13 +1,56 @@
+import json
+
+import numpy as np
 from django.core.management.base import BaseCommand
-from django.db.models import Avg
 
 from core.models import Session, Game
-from core.utils import float_formatter
+from core.utils import float_formatter, StreamingBulkUpdate
 
 from numbersgame.apps import NAME
 from numbersgame.models import Answer, Result
 
 
+def setting_signature(setting):
+    """String identifying the parameters the results have been computed with."""
+    return "{}|{}|{}|{}".format(
+        setting.factor,
+        setting.lower_bound,
+        setting.upper_bound,
+        setting.histogram_bin_size,
+    )
+
+
+def histogram_bins(setting):
+    """Lower bounds of the bins of the histogram of the answers."""
+    bins = []
+    current_value = setting.lower_bound
+    while current_value < setting.upper_bound:
+        bins.append(current_value)
+        current_value += setting.histogram_bin_size
+    return bins
+
+
+def histogram_bin_indices(bins, values):
+    """Indices of the bins of the values: the last bin starting before the value."""
+    return np.clip(np.digitize(values, bins) - 1, 0, None)
+
+
+def histogram_js_data(setting, bins, bin_counts):
+    return "\n".join(
+        [
+            "['{}-{}', {}],".format(
+                float_formatter(lower_bound, num_digits=3),
+                float_formatter(
+                    min(lower_bound + setting.histogram_bin_size, setting.upper_bound),
+                    num_digits=3,
+                ),
+                count,
+            )
+            for lower_bound, count in zip(bins, bin_counts)
+        ]
+    )
+
+
 class Command(BaseCommand):
     help = (
         "Updates the values required for the global_results page, to be run each time a new answer "
@@ -49,73 +92,49 @@ class Command(BaseCommand):
             return
         game = game.first()
 
-        try:
-            game.result_ng.delete()
-        except Result.DoesNotExist:
-            pass
-        result = Result.objects.create(
-            game=game,
-            histo_js_data="",
-        )
-        game.result_ng = result
-
-        answers = Answer.objects.filter(game=game, answer__isnull=False)
-
-        if answers:
-            categories = {}
-            current_value = game.numbers_setting.lower_bound
-            while current_value < game.numbers_setting.upper_bound:
-                categories[current_value] = 0
-                current_value += game.numbers_setting.histogram_bin_size
-
-            average = answers.aggregate(Avg("answer"))["answer__avg"]
-            corrected_average = game.numbers_setting.factor * average
-            best_answers = []
-            smallest_gap = game.numbers_setting.upper_bound
-            for answer in answers:
-                current_value = game.numbers_setting.lower_bound
-                while (
-                    current_value + game.numbers_setting.histogram_bin_size
-                    <= answer.answer
-                    and current_value + game.numbers_setting.histogram_bin_size
-                    < game.numbers_setting.upper_bound
+        setting = game.numbers_setting
+        answer_ids, answer_values = [], []
+        for answer_id, answer_value in Answer.objects.filter(
+            game=game, answer__isnull=False
+        ).values_list("id", "answer"):
+            answer_ids.append(answer_id)
+            answer_values.append(answer_value)
+
+        result_data = {
+            "histo_js_data": "",
+            "average": None,
+            "corrected_average": None,
+            "setting_signature": setting_signature(setting),
+            "num_answers": 0,
+            "sum_answers": 0,
+            "histo_counts_json_data": None,
+        }
+        if answer_ids:
+            answer_values = np.array(answer_values)
+            average = float(answer_values.mean())
+            corrected_average = setting.factor * average
+            gaps = np.abs(answer_values - corrected_average)
+            winners = gaps == gaps.min()
+            with StreamingBulkUpdate(Answer) as answer_writer:
+                for answer_id, gap, winner in zip(
+                    answer_ids, gaps.tolist(), winners.tolist()
                 ):
-                    current_value += game.numbers_setting.histogram_bin_size
-                categories[current_value] += 1
-
-                gap = abs(answer.answer - corrected_average)
-                if gap < smallest_gap:
-                    smallest_gap = gap
-                    best_answers = [answer]
-                elif gap == smallest_gap:
-                    best_answers.append(answer)
-                answer.gap = gap
-                answer.winner = False
-                answer.save()
-            for winner in best_answers:
-                winner.winner = True
-                winner.save()
-            game.result_ng.average = average
-            game.result_ng.corrected_average = corrected_average
-
-            game.result_ng.histo_js_data = "\n".join(
-                [
-                    "['{}-{}', {}],".format(
-                        float_formatter(key, num_digits=3),
-                        float_formatter(
-                            min(
-                                key + game.numbers_setting.histogram_bin_size,
-                                game.numbers_setting.upper_bound,
-                            ),
-                            num_digits=3,
-                        ),
-                        val,
-                    )
-                    for key, val in categories.items()
-                ]
+                    answer_writer.update(Answer(id=answer_id), gap=gap, winner=winner)
+
+            bins = histogram_bins(setting)
+            bin_counts = np.bincount(
+                histogram_bin_indices(bins, answer_values), minlength=len(bins)
             )
-            game.result_ng.save()
-            game.save()
+            result_data = {
+                "histo_js_data": histogram_js_data(setting, bins, bin_counts.tolist()),
+                "average": average,
+                "corrected_average": corrected_average,
+                "setting_signature": setting_signature(setting),
+                "num_answers": len(answer_ids),
+                "sum_answers": float(answer_values.sum()),
+                "histo_counts_json_data": json.dumps(bin_counts.tolist()),
+            }
+        Result.objects.update_or_create(game=game, defaults=result_data)
 
         self.stdout.write(
             "The global_results for the Numbers Game {} have been updated.".format(
@@ -0,0 +1,157 @@
+import json
+
+from django.core import management
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Session, Game, Player
+
+from numbersgame.apps import NAME
+from numbersgame.management.commands.numbersgame_results import (
+    histogram_bins,
+    histogram_bin_indices,
+    histogram_js_data,
+    setting_signature,
+)
+from numbersgame.models import Answer, Result
+
+
+def closest_values(answers, target):
+    """Returns the values of the answers that are the closest to target. There is at most one
+    such value on each side of the target, both are found with the (game, answer) index.
+    """
+    closest_below = (
+        answers.filter(answer__lte=target)
+        .order_by("-answer")
+        .values_list("answer", flat=True)
+        .first()
+    )
+    closest_above = (
+        answers.filter(answer__gte=target)
+        .order_by("answer")
+        .values_list("answer", flat=True)
+        .first()
+    )
+    values = [value for value in (closest_below, closest_above) if value is not None]
+    if not values:
+        return []
+    smallest_gap = min(abs(value - target) for value in values)
+    return [value for value in values if abs(value - target) == smallest_gap]
+
+
+class Command(BaseCommand):
+    help = (
+        "Updates the values required for the global_results page based on the latest "
+        "submission, using the running sum of the answers stored in the result."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--session", type=str, required=True)
+        parser.add_argument("--game", type=str, required=True)
+        parser.add_argument("--player", type=str, required=True)
+
+    def handle(self, *args, **options):
+        if not options["session"]:
+            self.stderr.write(
+                "ERROR: you need to give the URL tag of a session with the --session argument"
+            )
+            return
+        session = Session.objects.filter(url_tag=options["session"])
+        if not session.exists():
+            self.stderr.write(
+                "ERROR: no session with URL tag {} has been found".format(
+                    options["session"]
+                )
+            )
+            return
+        session = session.first()
+
+        if not options["game"]:
+            self.stderr.write(
+                "ERROR: you need to give the URL tag of a game with the --game argument"
+            )
+            return
+        game = Game.objects.filter(
+            session=session, url_tag=options["game"], game_type=NAME
+        )
+        if not game.exists():
+            self.stderr.write(
+                "ERROR: no game with URL tag {} has been found".format(options["game"])
+            )
+            return
+        game = game.first()
+
+        player = Player.objects.filter(name=options["player"], session=session)
+        if not player.exists():
+            self.stderr.write(
+                "ERROR: no player with name {} has been found".format(options["player"])
+            )
+            return
+        player = player.first()
+
+        new_answer = Answer.objects.filter(
+            game=game, player=player, answer__isnull=False
+        ).first()
+        if new_answer is None:
+            self.stderr.write(
+                "ERROR: the player {} has not submitted an answer".format(player.name)
+            )
+            return
+
+        setting = game.numbers_setting
+        answers = Answer.objects.filter(game=game, answer__isnull=False)
+        bins = histogram_bins(setting)
+        with transaction.atomic():
+            game_result = Result.objects.select_for_update().filter(game=game).first()
+            # The answer is read again once the lock is held, its gap is set once it has
+            # been taken into account
+            new_answer = Answer.objects.get(pk=new_answer.pk)
+            if new_answer.gap is not None:
+                return
+            # The running values can only be used if they have been computed with the
+            # current setting, otherwise we fall back to computing everything from scratch.
+            if (
+                game_result is None
+                or game_result.histo_counts_json_data is None
+                or game_result.setting_signature != setting_signature(setting)
+            ):
+                management.call_command(
+                    "numbersgame_results",
+                    session=session.url_tag,
+                    game=game.url_tag,
+                    stdout=self.stdout,
+                )
+                return
+
+            num_answers = game_result.num_answers + 1
+            sum_answers = game_result.sum_answers + new_answer.answer
+            average = sum_answers / num_answers
+            corrected_average = setting.factor * average
+
+            # Only the answers with the previous or the new winning values can change
+            previous_winning_values = []
+            if game_result.corrected_average is not None:
+                previous_winning_values = closest_values(
+                    answers.exclude(pk=new_answer.pk), game_result.corrected_average
+                )
+            winning_values = closest_values(answers, corrected_average)
+            answers.filter(answer__in=previous_winning_values).exclude(
+                answer__in=winning_values
+            ).update(winner=False)
+            answers.filter(answer__in=winning_values).exclude(winner=True).update(
+                winner=True
+            )
+            # Only the gap of the new answer is written, the others would all change
+            Answer.objects.filter(pk=new_answer.pk).update(
+                gap=abs(new_answer.answer - corrected_average)
+            )
+
+            bin_counts = json.loads(game_result.histo_counts_json_data)
+            bin_counts[int(histogram_bin_indices(bins, [new_answer.answer])[0])] += 1
+            game_result.average = average
+            game_result.corrected_average = corrected_average
+            game_result.num_answers = num_answers
+            game_result.sum_answers = sum_answers
+            game_result.histo_counts_json_data = json.dumps(bin_counts)
+            game_result.histo_js_data = histogram_js_data(setting, bins, bin_counts)
+            game_result.save()
@@ -41,6 +41,7 @@ class Answer(models.Model):
     )
     answer = models.FloatField()
     motivation = models.TextField()
+    # Distance to the corrected average when the answer was last scored, None until then
     gap = models.FloatField(null=True)
     winner = models.BooleanField(null=True, default=False)
     submission_time = models.DateTimeField(auto_now=True)
@@ -52,6 +53,7 @@ class Answer(models.Model):
                 fields=["game", "player"], name="ng_game_player_unique"
             )
         ]
+        indexes = [models.Index(fields=["game", "answer"], name="ng_game_answer_idx")]
 
     def __str__(self):
         return "[{}] {} - {} - {} {}".format(
@@ -70,6 +72,11 @@ class Result(models.Model):
     histo_js_data = models.TextField(null=True, blank=True)
     average = models.FloatField(null=True, blank=True)
     corrected_average = models.FloatField(null=True, blank=True)
+    # Running values used for incremental updates
+    setting_signature = models.CharField(max_length=200, blank=True, null=True)
+    num_answers = models.IntegerField(default=0)
+    sum_answers = models.FloatField(default=0)
+    histo_counts_json_data = models.TextField(null=True, blank=True)
 
     class Meta:
         ordering = ["game"]
@@ -2,12 +2,14 @@ import csv
 import os
 import random
 
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs
 from django.http import HttpResponse
 from django.shortcuts import render
 
 from core.game_views import GameIndexView, GameSubmitAnswerView, GameResultsView
 from .forms import SubmitAnswerForm
-from .models import Answer
+from .models import Answer, Result
 
 
 class Index(GameIndexView):
@@ -55,8 +57,21 @@ class Results(GameResultsView):
     def get(self, request, session_url_tag, game_url_tag):
         game = self.game
         context = self.context
-        answers = Answer.objects.filter(game=game, answer__isnull=False).order_by(
-            "answer"
+        # The stored gaps are not updated for every new answer, they are computed from the
+        # current corrected average instead
+        corrected_average = (
+            Result.objects.filter(game=game)
+            .values_list("corrected_average", flat=True)
+            .first()
+        )
+        if corrected_average is None:
+            current_gap = Value(None, output_field=FloatField())
+        else:
+            current_gap = Abs(F("answer") - corrected_average)
+        answers = (
+            Answer.objects.filter(game=game, answer__isnull=False)
+            .annotate(current_gap=current_gap)
+            .order_by("answer")
         )
         if answers:
             context["answers"] = answers
@@ -18,6 +18,7 @@ class SimpPokerConfig(GameConfig):
             URL_TAG,
             URL_NAMESPACE,
             management_commands="simppoker_computeresults",
+            update_management_commands="simppoker_updateresults",
             answer_model_fields=(
                 "probabilities_as_tuple",
                 "round_robin_position",
@@ -2,33 +2,63 @@ import numpy as np
 from django.core.management.base import BaseCommand
 
 from core.models import Session, Game
-from core.utils import float_formatter
+from core.utils import float_formatter, StreamingBulkUpdate
 from simp_poker.apps import NAME
 from simp_poker.models import Answer, Result
 
+# Fields of the answer describing the strategy, in the order used by the strategy arrays
+STRATEGY_FIELDS = (
+    "prob_p1_king",
+    "prob_p1_queen",
+    "prob_p1_jack",
+    "prob_p2_king",
+    "prob_p2_queen",
+    "prob_p2_jack",
+)
 
-def get_optimal_strategy():
-    return Answer(
-        prob_p1_king=1,
-        prob_p1_queen=1,
-        prob_p1_jack=1 / 3,
-        prob_p2_king=1,
-        prob_p2_queen=1 / 3,
-        prob_p2_jack=0,
-    )
+OPTIMAL_STRATEGY = np.array([1, 1, 1 / 3, 1, 1 / 3, 0])
 
 
-def get_score_against_opt(answer):
-    return expected_utility(answer, get_optimal_strategy())
+def get_optimal_strategy():
+    return Answer(**dict(zip(STRATEGY_FIELDS, OPTIMAL_STRATEGY.tolist())))
 
 
-def expected_utility_fix_roles(answer1, answer2):
-    pK = answer1.prob_p1_king
-    pQ = answer1.prob_p1_queen
-    pJ = answer1.prob_p1_jack
-    qK = answer2.prob_p2_king
-    qQ = answer2.prob_p2_queen
-    qJ = answer2.prob_p2_jack
+def get_score_against_opt(answer):
+    return float(expected_utility(answer_strategies([answer])[0], OPTIMAL_STRATEGY))
+
+
+def answer_strategies(answers):
+    """Returns the (n, 6) array of the strategies of the answers."""
+    return np.array(
+        [[getattr(answer, field) for field in STRATEGY_FIELDS] for answer in answers],
+        dtype=float,
+    ).reshape(-1, len(STRATEGY_FIELDS))
+
+
+def round_half_even(values, num_digits):
+    """Rounds the values as the built-in round() does. np.round rounds the scaled values and
+    the scaling can create ties that round() does not see, these are rounded one by one.
+    """
+    values = np.asarray(values, dtype=float)
+    flat_values = values.ravel()
+    rounded = np.round(flat_values, num_digits)
+    scaled = flat_values * 10**num_digits
+    ties = np.flatnonzero(np.abs(scaled - np.rint(scaled)) == 0.5)
+    rounded[ties] = [round(v, num_digits) for v in flat_values[ties].tolist()]
+    return rounded.reshape(values.shape)
+
+
+def expected_utility_fix_roles(strategies1, strategies2, num_digits=5):
+    """Expected utility of the strategies in strategies1 playing as player 1 against the ones
+    in strategies2 playing as player 2. Works on any arrays of strategies that broadcast
+    together, the last axis being the one of the STRATEGY_FIELDS. The utilities are rounded to
+    num_digits digits, or not at all if num_digits is None."""
+    pK = strategies1[..., 0]
+    pQ = strategies1[..., 1]
+    pJ = strategies1[..., 2]
+    qK = strategies2[..., 3]
+    qQ = strategies2[..., 4]
+    qJ = strategies2[..., 5]
     # euKQ = 2 * pK * qQ + 1 * pK * (1 - qQ) - 1 * (1 - pK)
     euKQ = pK * qQ + 2 * pK - 1
     # euKJ = 2 * pK * qJ + 1 * pK * (1 - qJ) - 1 * (1 - pK)
@@ -41,30 +71,103 @@ def expected_utility_fix_roles(answer1, answer2):
     euJK = -3 * pJ * qK + 2 * pJ - 1
     # euJQ = -2 * pJ * qQ + 1 * pJ * (1 - qQ) - 1 * (1 - pJ)
     euJQ = -3 * pJ * qQ + 2 * pJ - 1
-    return round((euKQ + euKJ + euQJ + euQK + euJK + euJQ) / 6, 5)
+    utility = (euKQ + euKJ + euQJ + euQK + euJK + euJQ) / 6
+    if num_digits is None:
+        return utility
+    return round_half_even(utility, num_digits)
 
 
-def expected_utility(answer1, answer2):
+def expected_utility(strategies1, strategies2, num_digits=5):
+    """Expected utility of the strategies in strategies1 against the ones in strategies2, each
+    player being player 1 half of the time. Broadcasts as expected_utility_fix_roles, a single
+    strategy can for instance be played against an (n, 6) array of strategies."""
     return (
-        expected_utility_fix_roles(answer1, answer2)
-        - expected_utility_fix_roles(answer2, answer1)
+        expected_utility_fix_roles(strategies1, strategies2, num_digits=num_digits)
+        - expected_utility_fix_roles(strategies2, strategies1, num_digits=num_digits)
     ) / 2
 
 
-def compute_best_response(answer):
-    pj = int(4 - 3 * answer.prob_p2_king - 3 * answer.prob_p2_queen > 0)
-    qq = int(3 * answer.prob_p1_jack - answer.prob_p1_king > 0)
-    return np.array([1, 1, pj, 1, qq, 0])
+def expected_utility_matrix(strategies):
+    """The (n, n) matrix of the expected utilities of all the pairs of strategies."""
+    return expected_utility(strategies[:, np.newaxis, :], strategies[np.newaxis, :, :])
 
 
-def compute_global_best_response(answers):
-    pj_coeff = sum(
-        4 - 3 * answer.prob_p2_king - 3 * answer.prob_p2_queen for answer in answers
-    )
-    qq_coeff = sum(3 * answer.prob_p1_jack - answer.prob_p1_king for answer in answers)
+def compute_best_responses(strategies):
+    """Returns the (n, 6) array of the best responses against the strategies."""
+    best_responses = np.zeros_like(strategies)
+    best_responses[:, [0, 1, 3]] = 1
+    best_responses[:, 2] = 4 - 3 * strategies[:, 3] - 3 * strategies[:, 4] > 0
+    best_responses[:, 4] = 3 * strategies[:, 2] - strategies[:, 0] > 0
+    return best_responses
+
+
+def compute_global_best_response(strategies):
+    pj_coeff = np.sum(4 - 3 * strategies[:, 3] - 3 * strategies[:, 4])
+    qq_coeff = np.sum(3 * strategies[:, 2] - strategies[:, 0])
     return np.array([1, 1, int(pj_coeff > 0), 1, int(qq_coeff > 0), 0])
 
 
+def rank_positions(scores):
+    """Returns the positions in the ranking by decreasing scores, tied scores sharing the best
+    position."""
+    descending_scores = scores[np.argsort(-scores, kind="stable")]
+    return np.searchsorted(-descending_scores, -scores, side="left") + 1
+
+
+def format_strategy(strategy):
+    return ",".join(float_formatter(v, num_digits=5) for v in strategy)
+
+
+def save_results(game, answers, strategies, rr_scores, strategy_sums):
+    """Computes the scores of the answers that do not depend on the other answers, ranks the
+    answers based on their round robin scores and saves everything. The sums of the strategies
+    are stored in the game result for the incremental updates."""
+    num_players = len(answers)
+
+    # Performance against optimum, the optimal strategy is ranked in the round robin
+    scores_against_opt = expected_utility(strategies, OPTIMAL_STRATEGY)
+    optimal_strategy_score = -scores_against_opt.sum()
+    rr_with_opt_scores = rr_scores + scores_against_opt
+    rr_positions = rank_positions(rr_scores)
+    rr_with_opt_positions = rank_positions(
+        np.append(rr_with_opt_scores, optimal_strategy_score)
+    )
+
+    # Best response against the strategies
+    best_responses = compute_best_responses(strategies)
+    scores_against_best_response = expected_utility(strategies, best_responses)
+
+    with StreamingBulkUpdate(Answer) as answer_writer:
+        for i, answer in enumerate(answers):
+            answer_writer.update(
+                answer,
+                round_robin_score=float(rr_scores[i]) / max(1, num_players - 1),
+                round_robin_position=int(rr_positions[i]),
+                round_robin_with_opt_score=float(rr_with_opt_scores[i]) / num_players,
+                round_robin_with_opt_position=int(rr_with_opt_positions[i]),
+                score_against_optimum=float(scores_against_opt[i]),
+                winner_against_optimum=bool(scores_against_opt[i] >= 0),
+                best_response=format_strategy(best_responses[i]),
+                score_against_best_response=float(scores_against_best_response[i]),
+            )
+
+    global_best_response = compute_global_best_response(strategies)
+    global_best_response_score = expected_utility(
+        global_best_response, strategies
+    ).mean()
+    defaults = {
+        "optimal_strategy_round_robin_score": float(optimal_strategy_score)
+        / max(1, num_players),
+        "optimal_strategy_round_robin_position": int(rr_with_opt_positions[-1]),
+        "global_best_response": format_strategy(global_best_response),
+        "global_best_response_rr_score": float(global_best_response_score),
+        "num_answers": num_players,
+    }
+    for field, strategy_sum in zip(STRATEGY_FIELDS, strategy_sums.tolist()):
+        defaults["sum_" + field] = strategy_sum
+    Result.objects.update_or_create(game=game, defaults=defaults)
+
+
 class Command(BaseCommand):
     help = "Computes the global_results of the simplified poker game."
 
@@ -105,93 +208,8 @@ class Command(BaseCommand):
         answers = list(Answer.objects.filter(game=game))
 
         if len(answers) > 0:
-
-            # Compute all the scores for the answers
-            optimal_strategy = get_optimal_strategy()
-            rr_scores = {a: 0 for a in answers}
-            rr_with_opt_scores = {}
-            scores_against_opt = {}
-            best_responses = {}
-            score_against_best_response = {}
-            optimal_strategy_score = 0
-            for i in range(len(answers)):
-                answer = answers[i]
-
-                # Round Robin tournament
-                for j in range(i + 1, len(answers)):
-                    opponent = answers[j]
-                    total_expected_u_answer = expected_utility(answer, opponent)
-                    rr_scores[answer] += total_expected_u_answer
-                    rr_scores[opponent] -= total_expected_u_answer
-
-                # Performance against optimum
-                score_against_opt = expected_utility(answer, optimal_strategy)
-                optimal_strategy_score -= score_against_opt
-                scores_against_opt[answer] = score_against_opt
-                rr_with_opt_scores[answer] = rr_scores[answer] + score_against_opt
-
-                # Best response against the strategy
-                best_response = compute_best_response(answer)
-                best_response_strat = Answer(
-                    prob_p1_king=best_response[0],
-                    prob_p1_queen=best_response[1],
-                    prob_p1_jack=best_response[2],
-                    prob_p2_king=best_response[3],
-                    prob_p2_queen=best_response[4],
-                    prob_p2_jack=best_response[5],
-                )
-                best_responses[answer] = best_response
-                score_against_best_response[answer] = expected_utility(
-                    answer, best_response_strat
-                )
-            ordered_rr_scores = sorted(rr_scores.values(), reverse=True)
-            ordered_rr_with_opt_scores = list(rr_with_opt_scores.values())
-            ordered_rr_with_opt_scores.append(optimal_strategy_score)
-            ordered_rr_with_opt_scores.sort(reverse=True)
-
-            num_players = len(rr_scores)
-            for answer in answers:
-                rr_score = rr_scores[answer]
-                answer.round_robin_score = rr_score / (max(1, num_players - 1))
-                answer.round_robin_position = ordered_rr_scores.index(rr_score) + 1
-                rr_score_with_opt = rr_with_opt_scores[answer]
-                answer.round_robin_with_opt_score = rr_score_with_opt / num_players
-                answer.round_robin_with_opt_position = (
-                    ordered_rr_with_opt_scores.index(rr_score_with_opt) + 1
-                )
-                score_against_opt = scores_against_opt[answer]
-                answer.score_against_optimum = score_against_opt
-                answer.winner_against_optimum = score_against_opt >= 0
-                answer.best_response = ",".join(
-                    float_formatter(v, num_digits=5) for v in best_responses[answer]
-                )
-                answer.score_against_best_response = score_against_best_response[answer]
-                answer.save()
-
-            global_best_response = compute_global_best_response(answers)
-            global_best_response_answer = Answer(
-                prob_p1_king=global_best_response[0],
-                prob_p1_queen=global_best_response[1],
-                prob_p1_jack=global_best_response[2],
-                prob_p2_king=global_best_response[3],
-                prob_p2_queen=global_best_response[4],
-                prob_p2_jack=global_best_response[5],
-            )
-            global_best_response_score = sum(
-                expected_utility(global_best_response_answer, a) for a in answers
-            ) / len(answers)
-            Result.objects.update_or_create(
-                game=game,
-                defaults={
-                    "optimal_strategy_round_robin_score": optimal_strategy_score
-                    / max(1, num_players),
-                    "optimal_strategy_round_robin_position": ordered_rr_with_opt_scores.index(
-                        optimal_strategy_score
-                    )
-                    + 1,
-                    "global_best_response": ",".join(
-                        float_formatter(v, num_digits=5) for v in global_best_response
-                    ),
-                    "global_best_response_rr_score": global_best_response_score,
-                },
-            )
+            strategies = answer_strategies(answers)
+            # Round Robin tournament, the diagonal is null as a strategy against itself has
+            # an expected utility of 0
+            rr_scores = expected_utility_matrix(strategies).sum(axis=1)
+            save_results(game, answers, strategies, rr_scores, strategies.sum(axis=0))
@@ -0,0 +1,116 @@
+import numpy as np
+from django.core import management
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Session, Game, Player
+from simp_poker.apps import NAME
+from simp_poker.management.commands.simppoker_computeresults import (
+    STRATEGY_FIELDS,
+    answer_strategies,
+    expected_utility,
+    save_results,
+)
+from simp_poker.models import Answer, Result
+
+
+class Command(BaseCommand):
+    help = (
+        "Updates the global_results of the simplified poker game based on the latest "
+        "submission: the round robin scores are computed from the running sums of the "
+        "strategies instead of playing all the pairs again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--session", type=str, required=True)
+        parser.add_argument("--game", type=str, required=True)
+        parser.add_argument("--player", type=str, required=True)
+
+    def handle(self, *args, **options):
+        if not options["session"]:
+            self.stderr.write(
+                "ERROR: you need to give the URL tag of a session with the --session argument"
+            )
+            return
+        session = Session.objects.filter(url_tag=options["session"])
+        if not session.exists():
+            self.stderr.write(
+                "ERROR: no session with URL tag {} has been found".format(
+                    options["session"]
+                )
+            )
+            return
+        session = session.first()
+
+        if not options["game"]:
+            self.stderr.write(
+                "ERROR: you need to give the URL tag of a game with the --game argument"
+            )
+            return
+        game = Game.objects.filter(
+            session=session, url_tag=options["game"], game_type=NAME
+        )
+        if not game.exists():
+            self.stderr.write(
+                "ERROR: no game with URL tag {} has been found".format(options["game"])
+            )
+            return
+        game = game.first()
+
+        player = Player.objects.filter(name=options["player"], session=session)
+        if not player.exists():
+            self.stderr.write(
+                "ERROR: no player with name {} has been found".format(options["player"])
+            )
+            return
+        player = player.first()
+
+        if not Answer.objects.filter(game=game, player=player).exists():
+            self.stderr.write(
+                "ERROR: the player {} has not submitted an answer".format(player.name)
+            )
+            return
+
+        with transaction.atomic():
+            # The game result is locked so that concurrent submissions are processed one
+            # after the other, the answers are only read once the lock is held.
+            game_result = Result.objects.select_for_update().filter(game=game).first()
+            answers = list(Answer.objects.filter(game=game))
+            new_answer = next(a for a in answers if a.player_id == player.id)
+            if new_answer.round_robin_position is not None:
+                # The answer has already been taken into account
+                return
+
+            # The running sums can only be used if they are up-to-date, otherwise we fall
+            # back to computing everything from scratch.
+            if (
+                game_result is None
+                or game_result.num_answers != len(answers) - 1
+                or any(
+                    a.round_robin_position is None
+                    for a in answers
+                    if a is not new_answer
+                )
+            ):
+                management.call_command(
+                    "simppoker_computeresults",
+                    session=session.url_tag,
+                    game=game.url_tag,
+                    stdout=self.stdout,
+                )
+                return
+
+            strategies = answer_strategies(answers)
+            strategy_sums = np.array(
+                [getattr(game_result, "sum_" + field) for field in STRATEGY_FIELDS]
+            )
+            strategy_sums += answer_strategies([new_answer])[0]
+            # The expected utility is linear in each strategy, the total utility against
+            # all the answers is thus the utility against their average strategy. The
+            # utilities are not rounded pair by pair here, the scores can thus differ from
+            # the ones of simppoker_computeresults in the last digits.
+            num_answers = len(answers)
+            rr_scores = num_answers * expected_utility(
+                strategies, strategy_sums / num_answers, num_digits=None
+            )
+            save_results(game, answers, strategies, rr_scores, strategy_sums)
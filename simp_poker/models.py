@@ -76,6 +76,14 @@ class Result(models.Model):
     optimal_strategy_round_robin_position = models.IntegerField(null=True, blank=True)
     global_best_response = models.CharField(max_length=100, null=True, blank=True)
     global_best_response_rr_score = models.FloatField(null=True, blank=True, default=0)
+    # Running sums of the strategies of the answers, used for incremental updates
+    num_answers = models.IntegerField(default=0)
+    sum_prob_p1_king = models.FloatField(default=0)
+    sum_prob_p1_queen = models.FloatField(default=0)
+    sum_prob_p1_jack = models.FloatField(default=0)
+    sum_prob_p2_king = models.FloatField(default=0)
+    sum_prob_p2_queen = models.FloatField(default=0)
+    sum_prob_p2_jack = models.FloatField(default=0)
 
     def global_best_response_as_answer(self):
         split_best_response = self.global_best_response.split(",")